@@ -1,27 +1,43 @@
 import os
+import time
 from flask import Flask
 from .config import config
-from .extensions import init_extensions, login_manager, db  # use shared db
-from .models import User, Tag
+from .extensions import init_extensions, login_manager
 
 def create_app(config_name=None):
+    """Build the app. Does no database I/O; schema and seed data are set up
+    by ``flask deploy`` (see app/cli.py)."""
     if config_name is None:
         config_name = os.environ.get('FLASK_ENV', 'development')
     
+    started = time.perf_counter()
+    phases = {}
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     
-    # Initialize config (fix database URL if needed)
-    config[config_name].init_app(app)
-    
     # Configure the database
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # Initialize config (fix database URLs, engine/pool options, replica bind)
+    config[config_name].init_app(app)
+    app.logger.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    phases['config'] = time.perf_counter() - started
+    
     # Removed separate db.init_app(app); init_extensions will handle it
     
+    mark = time.perf_counter()
     init_extensions(app)
     
+    # Per-request query/TMDb counts, Server-Timing and the slow-request log
+    from . import instrumentation
+    instrumentation.init_app(app)
+    
+    # /metrics in Prometheus format (request latency, DB pool, TMDb client)
+    from . import metrics
+    metrics.init_app(app)
+    phases['extensions'] = time.perf_counter() - mark
+    
     # User loader for Flask-Login
     @login_manager.user_loader
     def load_user(user_id):
@@ -29,6 +45,7 @@ def create_app(config_name=None):
         return User.query.get(int(user_id))
     
     # Register blueprints
+    mark = time.perf_counter()
     from .auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
     
@@ -40,12 +57,21 @@ def create_app(config_name=None):
     
     from .routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
+    phases['blueprints'] = time.perf_counter() - mark
+
+    # Management commands (flask deploy, create-user, ...)
+    from .cli import register_commands
+    register_commands(app)
+
+    # Image base URL from config now; TMDb's /configuration in the background
+    from .media.tmdb import tmdb_client
+    tmdb_client.init_app(app)
 
     # Jinja helper: tmdb_image_url(path, size)
     @app.context_processor
     def inject_tmdb_utils():
-        from .media.tmdb import tmdb_client
-        return {"tmdb_image_url": tmdb_client.build_image_url}
+        from .media.images import image_url
+        return {"tmdb_image_url": image_url}
 
     # Main routes
     @app.route('/')
@@ -55,11 +81,15 @@ def create_app(config_name=None):
     
     @app.route('/health')
     def health():
+        from sqlalchemy import text
         from .extensions import db
         try:
-            db.session.execute('SELECT 1')
+            db.session.execute(text('SELECT 1'))
             return {'status': 'ok'}, 200
         except Exception as e:
             return {'status': 'error', 'message': str(e)}, 500
     
-    return app
\ No newline at end of file
+    phases['total'] = time.perf_counter() - started
+    app.config['STARTUP_TIMINGS'] = phases
+    app.logger.info('startup %s', ' '.join(f'{name}={seconds * 1000:.0f}ms' for name, seconds in phases.items()))
+    return app
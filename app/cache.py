@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for a cache tier"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits / total) if total else 0.0,
+        }
+
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry TTL.
+
+    Values are stored JSON-encoded so callers can freely mutate what they get
+    back without corrupting the cached copy. Expired entries stay around until
+    LRU eviction so get_stale() can still serve them while upstream is down.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.time():
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self.stats.record(entry is not None)
+        return json.loads(entry[0]) if entry is not None else None
+
+    def get_stale(self, key):
+        """Return the entry even if it has expired (not counted in stats)"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return json.loads(entry[0]) if entry is not None else None
+
+    def set(self, key, value, ttl):
+        encoded = json.dumps(value)
+        with self._lock:
+            self._entries[key] = (encoded, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Cache shared by every worker on the host through a SQLite file.
+
+    Expired rows are kept for ``stale_grace`` seconds so get_stale() can fall
+    back to them.
+    """
+
+    PURGE_EVERY = 500  # writes between sweeps of expired rows
+
+    def __init__(self, path, stale_grace=24 * 60 * 60):
+        self.path = path
+        self.stale_grace = stale_grace
+        self.stats = CacheStats()
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key):
+        """(value, seconds left) for a live entry, (None, 0) otherwise"""
+        now = time.time()
+        row = self._connect().execute(
+            'SELECT value, expires_at FROM cache_entries WHERE key = ? AND expires_at >= ?',
+            (key, now),
+        ).fetchone()
+        self.stats.record(row is not None)
+        if row is None:
+            return None, 0
+        return json.loads(row[0]), row[1] - now
+
+    def get_stale(self, key):
+        """Return the row even if it has expired (not counted in stats)"""
+        row = self._connect().execute(
+            'SELECT value FROM cache_entries WHERE key = ?', (key,),
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute(
+                'DELETE FROM cache_entries WHERE expires_at < ?',
+                (time.time() - self.stale_grace,),
+            )
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache_entries')
+
+
+class TieredCache:
+    """Check the in-process tier first, then the optional shared tier.
+
+    Shared hits are copied into the local tier so the next lookup in this
+    worker doesn't leave the process, for at most ``promote_ttl`` seconds
+    and never past the shared entry's own expiry.
+    """
+
+    def __init__(self, local, shared=None, promote_ttl=60):
+        self.local = local
+        self.shared = shared
+        self.promote_ttl = promote_ttl
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value, remaining = self.shared.get_with_ttl(key)
+            if value is not None:
+                self.local.set(key, value, min(remaining, self.promote_ttl))
+        return value
+
+    def get_stale(self, key):
+        """Last known value regardless of expiry, from either tier"""
+        value = self.local.get_stale(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get_stale(key)
+        return value
+
+    def set(self, key, value, ttl):
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        stats = {'local': self.local.stats.as_dict()}
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats.as_dict()
+        return stats
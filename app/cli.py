@@ -0,0 +1,312 @@
+import os
+import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text
+from .extensions import db
+from .models import User, Media, MediaCast, MediaDiarySummary, Viewing, ViewingSearch, Tag
+
+# create_app registers these commands in every worker, so the modules they
+# drive are imported inside each command rather than here
+
+# Tags a brand-new diary starts with
+DEFAULT_TAGS = ['funny', 'action', 'drama', 'sci-fi', 'horror', 'romance', 'thriller']
+
+@click.command()
+@with_appcontext
+def create_default_users():
+    """Create default users Alex and Carrie"""
+    alex = User.query.filter_by(username='alex').first()
+    if not alex:
+        alex = User(username='alex')
+        alex.set_password('alex')
+        db.session.add(alex)
+        click.echo('Created user: alex')
+    else:
+        click.echo('User alex already exists')
+    
+    carrie = User.query.filter_by(username='carrie').first()
+    if not carrie:
+        carrie = User(username='carrie')
+        carrie.set_password('carrie')
+        db.session.add(carrie)
+        click.echo('Created user: carrie')
+    else:
+        click.echo('User carrie already exists')
+    
+    db.session.commit()
+    click.echo('Default users setup complete')
+
+@click.command()
+@click.option('--username', prompt=True, help='Username for the new user')
+@click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True, help='Password for the new user')
+@with_appcontext
+def create_user(username, password):
+    """Create a new user"""
+    if User.query.filter_by(username=username.lower()).first():
+        click.echo(f'User {username} already exists!')
+        return
+    
+    user = User(username=username.lower())
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    click.echo(f'Created user: {username}')
+
+@click.command()
+@with_appcontext
+def list_users():
+    """List all users"""
+    users = User.query.all()
+    if not users:
+        click.echo('No users found')
+        return
+    
+    click.echo('Users:')
+    for user in users:
+        click.echo(f'  - {user.username} (ID: {user.id}, Created: {user.created_at})')
+
+@click.command()
+@click.option('--username', prompt=True, help='Username to reset password for')
+@click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True, help='New password')
+@with_appcontext
+def reset_password(username, password):
+    """Reset a user's password"""
+    user = User.query.filter_by(username=username.lower()).first()
+    if not user:
+        click.echo(f'User {username} not found!')
+        return
+    
+    user.set_password(password)
+    db.session.commit()
+    click.echo(f'Password reset for user: {username}')
+
+@click.command()
+@with_appcontext
+def seed_tags():
+    """Add the default tags to a diary that has none"""
+    from .diary.tags import resolve_tags
+    if Tag.query.count():
+        click.echo('Tags already present')
+        return
+    resolve_tags(DEFAULT_TAGS)
+    db.session.commit()
+    click.echo(f'Seeded {len(DEFAULT_TAGS)} tags')
+
+@click.command()
+@with_appcontext
+def deploy():
+    """Release step: bring the schema and derived tables up to date and seed
+    default data.
+    
+    Runs once per deploy (Railway's preDeployCommand) so web workers boot
+    without touching the database. Safe to run repeatedly; on a database
+    created by an older version it adds the projected media columns,
+    backfills them and builds the diary summary and search tables.
+    """
+    if os.path.isdir(os.path.join(os.path.dirname(current_app.root_path), 'migrations')):
+        from flask_migrate import upgrade
+        upgrade()
+        click.echo('Migrations applied')
+    else:
+        # create_all only creates missing tables; it never alters existing ones
+        tables = set(inspect(db.engine).get_table_names())
+        db.create_all()
+        created = set(inspect(db.engine).get_table_names()) - tables
+        if created:
+            click.echo(f'Created tables: {", ".join(sorted(created))}')
+        # create_all skips indexes on tables that already exist
+        with db.engine.begin() as conn:
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_viewings_media_id ON viewings (media_id)'))
+        backfill_media_details.callback(batch_size=100)
+    
+    # Tables derived from viewings start out empty next to an existing diary
+    if db.session.query(Viewing.id).first() is not None:
+        if db.session.query(MediaDiarySummary.media_id).first() is None:
+            rebuild_diary_summary.callback()
+        if db.session.query(ViewingSearch.viewing_id).first() is None:
+            rebuild_search_index.callback()
+    seed_tags.callback()
+
+@click.command()
+@with_appcontext
+def init_db():
+    """Initialize the database"""
+    db.create_all()
+    click.echo('Database initialized')
+    
+    # Create default users if none exist
+    if User.query.count() == 0:
+        create_default_users.callback()
+
+@click.command()
+@click.option('--older-than-days', type=int, default=None, help='Refresh rows not updated for this many days (default: MEDIA_STALE_AFTER_DAYS)')
+@click.option('--concurrency', type=int, default=4, show_default=True, help='Parallel TMDb fetches')
+@click.option('--limit', type=int, default=None, help='Refresh at most this many rows')
+@with_appcontext
+def refresh_media(older_than_days, concurrency, limit):
+    """Refresh stale cached TMDb details in bulk"""
+    from .media import services as media_services
+    app = current_app._get_current_object()
+    if older_than_days is None:
+        older_than_days = app.config.get('MEDIA_STALE_AFTER_DAYS', 7)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    
+    query = db.session.query(Media.id)\
+                      .filter(db.or_(Media.details_fetched_at.is_(None), Media.details_fetched_at < cutoff))\
+                      .order_by(Media.details_fetched_at)
+    if limit:
+        query = query.limit(limit)
+    media_ids = [row.id for row in query]
+    db.session.remove()
+    
+    if not media_ids:
+        click.echo('No stale media found')
+        return
+    
+    def refresh(media_id):
+        with app.app_context():
+            try:
+                return media_services.refresh_media(media_id)
+            except Exception as e:
+                db.session.rollback()
+                click.echo(f'  media {media_id} failed: {e}', err=True)
+                return False
+            finally:
+                db.session.remove()
+    
+    refreshed = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(refresh, media_id) for media_id in media_ids]
+        for future in as_completed(futures):
+            if future.result():
+                refreshed += 1
+    
+    click.echo(f'Refreshed {refreshed} of {len(media_ids)} stale media rows')
+
+def _add_missing_columns(model):
+    """ALTER TABLE ... ADD COLUMN for model columns the live table lacks"""
+    table = model.__table__
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    added = []
+    with db.engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                added.append(column.name)
+    return added
+
+@click.command()
+@click.option('--batch-size', type=int, default=100, show_default=True, help='Rows per transaction')
+@with_appcontext
+def backfill_media_details(batch_size):
+    """Add the projected media columns and move cached_json into them"""
+    from .media import services as media_services
+    added = _add_missing_columns(Media)
+    if added:
+        click.echo(f'Added media columns: {", ".join(added)}')
+    MediaCast.__table__.create(db.engine, checkfirst=True)
+    
+    total = 0
+    while True:
+        batch = Media.query.filter(Media.cached_json.isnot(None), Media.details_fetched_at.is_(None))\
+                           .order_by(Media.id).limit(batch_size).all()
+        if not batch:
+            break
+        for media in batch:
+            fetched_at = media.updated_at
+            media_services.apply_details(media, media.cached_json)
+            # Keep the original fetch time so staleness checks stay honest
+            media.details_fetched_at = fetched_at
+        db.session.commit()
+        total += len(batch)
+        click.echo(f'  projected {total} rows')
+    
+    click.echo(f'Backfilled {total} media rows')
+
+@click.command()
+@with_appcontext
+def rebuild_diary_summary():
+    """Rebuild the media_diary_summary table from all viewings"""
+    from .diary.summary import rebuild_summaries
+    db.create_all()
+    count = rebuild_summaries()
+    click.echo(f'Rebuilt diary summary for {count} media items')
+
+@click.command()
+@with_appcontext
+def rebuild_search_index():
+    """Create the diary full-text index if needed and reindex every viewing"""
+    from .diary import fulltext
+    db.create_all()
+    count = fulltext.rebuild_search_index()
+    click.echo(f'Reindexed viewings of {count} media items')
+
+@click.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--username', required=True, help='User whose diary receives the viewings')
+@click.option('--format', 'fmt', type=click.Choice(['letterboxd', 'imdb']), default=None, help='Export format (default: detect from the header)')
+@click.option('--batch-size', type=int, default=200, show_default=True, help='Rows per transaction')
+@click.option('--concurrency', type=int, default=4, show_default=True, help='Parallel TMDb title lookups')
+@click.option('--restart', is_flag=True, help='Ignore saved progress and start from the first row')
+@with_appcontext
+def import_diary(path, username, fmt, batch_size, concurrency, restart):
+    """Import a Letterboxd or IMDb CSV export (resumes if interrupted)"""
+    from .diary.importer import ImportJob
+    user = User.query.filter_by(username=username.lower()).first()
+    if not user:
+        click.echo(f'User {username} not found!')
+        return
+    
+    job = ImportJob(path)
+    if restart:
+        job.reset()
+    
+    def report(stats):
+        click.echo(f'  {stats.rows} rows: {stats.imported} imported, {stats.duplicates} duplicates, '
+                   f'{stats.unresolved} unresolved, {stats.skipped} skipped')
+    
+    status = job.run(user.id, fmt, batch_size, concurrency, on_progress=report)
+    click.echo(f"Import {status['state']}: {status['imported']} viewings added, "
+               f"{status['new_media']} new titles (run refresh-media to fetch their details)")
+
+@click.command()
+@click.argument('output', default='-', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+@click.option('--year', type=int, help='Only viewings from this year')
+@click.option('--media-type', type=click.Choice(['movie', 'tv']), help='Only movies or only TV')
+@click.option('--rating', type=int, help='Only viewings rated at least this')
+@click.option('--tag', help='Only viewings with this tag')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Rows fetched per cursor batch')
+@with_appcontext
+def export_diary(output, fmt, compress, year, media_type, rating, tag, batch_size):
+    """Export the diary to OUTPUT (default stdout) as CSV or NDJSON"""
+    from .diary.export import export_diary as stream_export
+    filters = {'year': year, 'media_type': media_type, 'rating': rating, 'tag': tag}
+    with click.open_file(output, 'wb') as fh:
+        for chunk in stream_export(filters, fmt, compress, batch_size):
+            fh.write(chunk)
+
+@click.command()
+@with_appcontext
+def create_tag_trigram_index():
+    """Create the pg_trgm GIN index used by TAG_AUTOCOMPLETE_MODE=trigram"""
+    if db.engine.dialect.name != 'postgresql':
+        click.echo('Trigram autocomplete needs Postgres; the in-memory index is used instead')
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tags_name_trgm ON tags USING gin (name gin_trgm_ops)'))
+    click.echo('Created ix_tags_name_trgm')
+
+
+def register_commands(app):
+    """Add the management commands to ``flask``"""
+    for command in (create_default_users, create_user, list_users, reset_password, seed_tags, deploy,
+                    init_db, refresh_media, backfill_media_details, rebuild_diary_summary,
+                    rebuild_search_index, import_diary, export_diary, create_tag_trigram_index):
+        app.cli.add_command(command)
@@ -10,19 +10,151 @@ class Config:
     
     @staticmethod
     def init_app(app):
+        from .database import engine_options
+        
         # Fix postgres:// URL to postgresql:// for SQLAlchemy 1.4+
         database_url = app.config.get('SQLALCHEMY_DATABASE_URI')
         if database_url and database_url.startswith('postgres://'):
-            app.config['SQLALCHEMY_DATABASE_URI'] = database_url.replace('postgres://', 'postgresql://', 1)
+            database_url = database_url.replace('postgres://', 'postgresql://', 1)
+            app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+        
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config, database_url)
+        
+        replica_url = app.config.get('DATABASE_REPLICA_URL')
+        if replica_url:
+            if replica_url.startswith('postgres://'):
+                replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+            app.config['SQLALCHEMY_BINDS'] = {'replica': dict(engine_options(app.config, replica_url), url=replica_url)}
     TMDB_API_KEY = os.environ.get('TMDB_API_KEY')
     WTF_CSRF_ENABLED = True
     
+    # Connection pool per worker (server databases only): connections kept
+    # open, extra ones allowed under load, seconds to wait for a free one,
+    # and seconds before a connection is replaced. Pre-ping checks each
+    # connection on checkout so one dropped while idle is never used.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    # Postgres statement timeout in milliseconds (0 = none)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    # 'session' for a direct connection or session pooling; 'transaction'
+    # behind PgBouncer-style transaction pooling (no server-side prepared
+    # statements or per-connection settings)
+    DB_POOLER_MODE = os.environ.get('DB_POOLER_MODE', 'session')
+    # Optional read replica for the diary, search and title pages' reads
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    
     SESSION_COOKIE_SECURE = os.environ.get('FLASK_ENV') == 'production'
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     
     TMDB_BASE_URL = 'https://api.themoviedb.org/3'
-    TMDB_IMAGE_BASE_URL = 'https://image.tmdb.org/t/p'
+    TMDB_IMAGE_BASE_URL = os.environ.get('TMDB_IMAGE_BASE_URL', 'https://image.tmdb.org/t/p')
+    
+    # How often a background thread re-reads TMDb's image base URL (0 turns
+    # it off and keeps TMDB_IMAGE_BASE_URL), and how soon to retry a failure
+    TMDB_IMAGE_CONFIG_REFRESH_SECONDS = int(os.environ.get('TMDB_IMAGE_CONFIG_REFRESH_SECONDS', 24 * 60 * 60))
+    TMDB_IMAGE_CONFIG_RETRY_SECONDS = int(os.environ.get('TMDB_IMAGE_CONFIG_RETRY_SECONDS', 5 * 60))
+    
+    # Serve posters/backdrops through /img/<size>/<file>, fetched once into a
+    # disk cache shared by every worker. Resizing to sizes TMDb doesn't offer
+    # and WebP for browsers that accept it need Pillow installed.
+    IMAGE_PROXY_ENABLED = os.environ.get('IMAGE_PROXY_ENABLED', '').lower() in ('1', 'true', 'yes')
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'instance', 'image-cache'))
+    IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    IMAGE_PROXY_SIZES = ('w45', 'w92', 'w154', 'w185', 'w300', 'w342', 'w500', 'w780', 'w1280', 'h632', 'original')
+    IMAGE_PROXY_WEBP = os.environ.get('IMAGE_PROXY_WEBP', 'true').lower() in ('1', 'true', 'yes')
+    IMAGE_PROXY_WEBP_QUALITY = int(os.environ.get('IMAGE_PROXY_WEBP_QUALITY', 80))
+    
+    # TMDb response cache: in-process LRU plus an optional SQLite file shared
+    # by every gunicorn worker on the host
+    TMDB_CACHE_SIZE = int(os.environ.get('TMDB_CACHE_SIZE', 1024))
+    TMDB_SHARED_CACHE_PATH = os.environ.get('TMDB_SHARED_CACHE_PATH')
+    # Seconds to cache each endpoint, matched on the longest prefix; endpoints
+    # without a match are never cached
+    TMDB_CACHE_TTLS = {
+        '/search/': 10 * 60,
+        '/movie/': 24 * 60 * 60,
+        '/tv/': 24 * 60 * 60,
+        '/configuration': 24 * 60 * 60,
+        '/find/': 24 * 60 * 60,
+    }
+    
+    # Threads used to run movie/TV (and extra page) searches in parallel, and
+    # TMDb pages fetched per media type for each page of combined results
+    TMDB_SEARCH_WORKERS = int(os.environ.get('TMDB_SEARCH_WORKERS', 4))
+    TMDB_SEARCH_PAGES = int(os.environ.get('TMDB_SEARCH_PAGES', 1))
+    
+    # Type-ahead search: shorter queries never reach TMDb, and the search box
+    # waits this long after the last keystroke before sending a request
+    SEARCH_MIN_QUERY_LENGTH = int(os.environ.get('SEARCH_MIN_QUERY_LENGTH', 2))
+    SEARCH_DEBOUNCE_MS = int(os.environ.get('SEARCH_DEBOUNCE_MS', 300))
+    
+    # Seconds the diary's year/tag filter facets may be reused before another
+    # worker's writes are picked up (this worker's writes invalidate at once)
+    DIARY_FACET_TTL = int(os.environ.get('DIARY_FACET_TTL', 60))
+    
+    # Rendered diary card HTML: entries kept in-process, seconds an entry may
+    # live, and an optional SQLite file to share cards between workers
+    DIARY_CARD_CACHE_SIZE = int(os.environ.get('DIARY_CARD_CACHE_SIZE', 2000))
+    DIARY_CARD_CACHE_TTL = int(os.environ.get('DIARY_CARD_CACHE_TTL', 24 * 60 * 60))
+    DIARY_CARD_CACHE_PATH = os.environ.get('DIARY_CARD_CACHE_PATH')
+    
+    # Bulk CSV import: where uploads and their progress files are kept, rows
+    # per transaction and parallel TMDb title lookups
+    IMPORT_DIR = os.environ.get('IMPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'instance', 'imports'))
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 200))
+    IMPORT_CONCURRENCY = int(os.environ.get('IMPORT_CONCURRENCY', 4))
+    
+    # Maximum hits returned by the diary's full-text search
+    DIARY_SEARCH_LIMIT = int(os.environ.get('DIARY_SEARCH_LIMIT', 50))
+    
+    # Viewings fetched per server-side cursor batch when exporting the diary
+    DIARY_EXPORT_BATCH_SIZE = int(os.environ.get('DIARY_EXPORT_BATCH_SIZE', 1000))
+    
+    # Tag autocomplete: 'memory' (in-process index, refreshed at most every
+    # TAG_AUTOCOMPLETE_TTL seconds) or 'trigram' (Postgres pg_trgm index)
+    TAG_AUTOCOMPLETE_MODE = os.environ.get('TAG_AUTOCOMPLETE_MODE', 'memory')
+    TAG_AUTOCOMPLETE_TTL = int(os.environ.get('TAG_AUTOCOMPLETE_TTL', 60))
+    
+    # Client-side TMDb budget (requests/second, burst size). Set
+    # TMDB_RATE_LIMIT_STATE_PATH to share the budget between workers.
+    TMDB_RATE_LIMIT = float(os.environ.get('TMDB_RATE_LIMIT', 35))
+    TMDB_RATE_BURST = int(os.environ.get('TMDB_RATE_BURST', 20))
+    TMDB_RATE_LIMIT_STATE_PATH = os.environ.get('TMDB_RATE_LIMIT_STATE_PATH')
+    # Consecutive failures before failing fast, and seconds before a retry
+    TMDB_BREAKER_THRESHOLD = int(os.environ.get('TMDB_BREAKER_THRESHOLD', 5))
+    TMDB_BREAKER_RESET_SECONDS = int(os.environ.get('TMDB_BREAKER_RESET_SECONDS', 30))
+    
+    # Request instrumentation: Server-Timing header on every response, a
+    # JSON log line for requests slower than SLOW_REQUEST_MS (0 turns it
+    # off), and cProfile dumps for a fraction of requests (0 = never)
+    SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'instance', 'profiles'))
+    
+    # /metrics: directory where each gunicorn worker writes its metrics so
+    # any worker can answer a scrape (unset = this process only; clear it on
+    # deploy), how often a worker rewrites its file, and the bearer token
+    # the scraper must send (unset = only direct requests from a private
+    # network are answered)
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_SECONDS = int(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # App logger level; create_app logs how long each startup phase took at INFO
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    
+    # Media details older than this are served stale and refreshed in the background
+    MEDIA_STALE_AFTER_DAYS = int(os.environ.get('MEDIA_STALE_AFTER_DAYS', 7))
+    MEDIA_REFRESH_WORKERS = int(os.environ.get('MEDIA_REFRESH_WORKERS', 2))
+    # Top-billed cast members kept per title, and whether to also keep the
+    # full TMDb payload (zlib-compressed, loaded only on demand)
+    MEDIA_CAST_LIMIT = int(os.environ.get('MEDIA_CAST_LIMIT', 12))
+    MEDIA_STORE_RAW_DETAILS = os.environ.get('MEDIA_STORE_RAW_DETAILS', '').lower() in ('1', 'true', 'yes')
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,92 @@
+import contextvars
+from functools import wraps
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event
+
+# Set while a view marked @read_replica runs
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def engine_options(config, url):
+    """SQLAlchemy engine options for ``url`` from the DB_* settings.
+
+    Pool sizing only applies to server databases; SQLite keeps its default
+    pool. In 'session' pooler mode the statement timeout is sent as a
+    connection option. Behind a transaction-pooling proxy connection
+    options and server-side prepared statements can't be used, so the
+    timeout is set per transaction instead (see RoutingSession) and
+    psycopg 3's automatic prepares are switched off. psycopg2 never
+    prepares server-side.
+    """
+    if not url or url.startswith('sqlite'):
+        return {}
+
+    options = {
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 5),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+    }
+    connect_args = {}
+    timeout = config.get('DB_STATEMENT_TIMEOUT_MS', 0)
+    if config.get('DB_POOLER_MODE') == 'transaction':
+        if url.startswith('postgresql+psycopg:'):
+            connect_args['prepare_threshold'] = None
+    elif timeout:
+        connect_args['options'] = f'-c statement_timeout={int(timeout)}'
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+class RoutingSession(Session):
+    """Session that sends a read-only view's SELECTs to the replica.
+
+    Inside a @read_replica view, SELECTs go to the 'replica' bind until the
+    session writes anything; from then on, and everywhere else, everything
+    uses the primary so a request always reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and _replica_reads.get() and not self._flushing
+                and not self.info.get('wrote') and isinstance(clause, Select)):
+            engine = self._db.engines.get('replica')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _note_write(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_begin')
+def _set_statement_timeout(session, transaction, connection):
+    # Transaction pooling: session settings would leak to other clients, so
+    # the timeout is scoped to each transaction
+    config = current_app.config if current_app else {}
+    timeout = config.get('DB_STATEMENT_TIMEOUT_MS', 0)
+    if (timeout and config.get('DB_POOLER_MODE') == 'transaction'
+            and connection.dialect.name == 'postgresql'):
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+
+def read_replica(view):
+    """Let a read-only view's queries run on the replica when one is configured"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapped
@@ -0,0 +1,94 @@
+import bisect
+import itertools
+import threading
+import time
+from sqlalchemy import func
+from ..models import Tag, viewing_tags
+from ..extensions import db
+from .versioning import diary_version
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _ranked(entries):
+    """Most-used tags first, then alphabetical"""
+    return sorted(entries, key=lambda entry: (-entry[2], entry[0]))
+
+
+class TagIndex:
+    """In-memory tag autocomplete over a sorted array of lowercased names.
+
+    Prefix matches are a bisect into the sorted array; substring matches
+    are a scan of the (small) remainder. Both are ranked by how many
+    viewings use the tag. The index is rebuilt on the next lookup after the
+    diary version moves on, or after ``ttl`` seconds to pick up other
+    workers' writes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = None  # (version, built_at, keys, entries)
+
+    def _build(self):
+        rows = db.session.query(Tag.name, func.count(viewing_tags.c.viewing_id))\
+                         .outerjoin(viewing_tags, viewing_tags.c.tag_id == Tag.id)\
+                         .group_by(Tag.id, Tag.name).all()
+        entries = sorted((name.lower(), name, count) for name, count in rows)
+        return [entry[0] for entry in entries], entries
+
+    def _load(self, ttl):
+        version = diary_version.value
+        now = time.time()
+        entry = self._entry
+        if entry and entry[0] == version and now - entry[1] < ttl:
+            return entry[2], entry[3]
+
+        keys, entries = self._build()
+        with self._lock:
+            self._entry = (version, now, keys, entries)
+        return keys, entries
+
+    def suggest(self, q, limit=10, ttl=60):
+        """Up to ``limit`` tags whose name starts with ``q``, then ones containing it"""
+        keys, entries = self._load(ttl)
+        q = q.lower()
+
+        start = bisect.bisect_left(keys, q)
+        end = bisect.bisect_left(keys, q + '\uffff', lo=start)
+        prefix = _ranked(entries[start:end])
+        if len(prefix) >= limit:
+            return [{'name': name, 'count': count} for _, name, count in prefix[:limit]]
+
+        substring = _ranked(
+            entry for entry in itertools.chain(entries[:start], entries[end:]) if q in entry[0]
+        )
+        return [{'name': name, 'count': count} for _, name, count in (prefix + substring)[:limit]]
+
+    def clear(self):
+        with self._lock:
+            self._entry = None
+
+
+def suggest_trigram(q, limit=10):
+    """Database-side autocomplete for Postgres backed by a pg_trgm GIN index.
+
+    Needs the index from ``flask create-tag-trigram-index``; ranks prefix
+    matches first, then by trigram similarity and usage.
+    """
+    pattern = _escape_like(q)
+    usage = func.count(viewing_tags.c.viewing_id)
+    rows = db.session.query(Tag.name, usage)\
+                     .outerjoin(viewing_tags, viewing_tags.c.tag_id == Tag.id)\
+                     .filter(Tag.name.ilike(f'%{pattern}%', escape='\\'))\
+                     .group_by(Tag.id, Tag.name)\
+                     .order_by(Tag.name.ilike(f'{pattern}%', escape='\\').desc(),
+                               func.similarity(Tag.name, q).desc(),
+                               usage.desc(),
+                               Tag.name)\
+                     .limit(limit).all()
+    return [{'name': name, 'count': count} for name, count in rows]
+
+
+tag_index = TagIndex()
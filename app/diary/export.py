@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+import zlib
+from sqlalchemy import select
+from ..models import Media, Tag, User, Viewing, viewing_tags
+from ..extensions import db
+from .fulltext import filter_viewings
+
+EXPORT_FIELDS = ['watched_on', 'user', 'title', 'media_type', 'release_year', 'tmdb_id',
+                 'rating', 'rewatch', 'tags', 'comment']
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def export_rows(filters, batch_size=1000):
+    """Yield one dict per viewing matching the diary filters, newest first.
+
+    Rows are plain columns read through a server-side cursor
+    (``yield_per``), so only ``batch_size`` of them are held at a time, and
+    each batch's tags come from a single IN query rather than one per row.
+    """
+    query = db.session.query(Viewing.id, Viewing.watched_on, User.username, Media.title,
+                             Media.media_type, Media.release_year, Media.tmdb_id,
+                             Viewing.rating, Viewing.rewatch, Viewing.comment)\
+                      .join(Media, Media.id == Viewing.media_id)\
+                      .join(User, User.id == Viewing.user_id)
+    query = filter_viewings(query, filters)
+    if filters.get('sort') == 'highest_rated':
+        query = query.order_by(Viewing.rating.desc(), Viewing.watched_on.desc(), Viewing.id.desc())
+    else:
+        query = query.order_by(Viewing.watched_on.desc(), Viewing.id.desc())
+
+    result = db.session.execute(query.statement.execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        tags = {}
+        for viewing_id, name in db.session.execute(
+                select(viewing_tags.c.viewing_id, Tag.name)
+                .join(Tag, Tag.id == viewing_tags.c.tag_id)
+                .where(viewing_tags.c.viewing_id.in_([row.id for row in batch]))
+                .order_by(Tag.name)):
+            tags.setdefault(viewing_id, []).append(name)
+
+        for row in batch:
+            yield {
+                'watched_on': row.watched_on.isoformat(),
+                'user': row.username,
+                'title': row.title,
+                'media_type': row.media_type,
+                'release_year': row.release_year,
+                'tmdb_id': row.tmdb_id,
+                'rating': row.rating,
+                'rewatch': row.rewatch,
+                'tags': tags.get(row.id, []),
+                'comment': row.comment,
+            }
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(EXPORT_FIELDS)
+    for row in rows:
+        row = dict(row, tags=', '.join(row['tags']), rewatch='yes' if row['rewatch'] else '')
+        yield line([row[field] for field in EXPORT_FIELDS])
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _buffered(lines, size=64 * 1024):
+    """Join lines into ~64KB byte chunks so each write isn't a single row"""
+    pending = []
+    length = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(pending)
+            pending = []
+            length = 0
+    if pending:
+        yield b''.join(pending)
+
+
+def export_diary(filters, fmt='csv', compress=False, batch_size=1000):
+    """Byte chunks of the filtered diary as CSV or NDJSON, gzipped if asked"""
+    lines = _csv_lines if fmt == 'csv' else _ndjson_lines
+    chunks = _buffered(lines(export_rows(filters, batch_size)))
+    return _gzip(chunks) if compress else chunks
@@ -0,0 +1,66 @@
+import threading
+import time
+from ..models import Viewing, Tag, viewing_tags
+from ..extensions import db
+from .versioning import diary_version
+
+
+def compute_facets():
+    """Year and tag filter options with the number of media items under each.
+
+    A single pass over (year, media, tag) rows feeds both facets; tag names
+    are then looked up by id.
+    """
+    rows = db.session.query(
+        db.extract('year', Viewing.watched_on),
+        Viewing.media_id,
+        viewing_tags.c.tag_id,
+    ).outerjoin(viewing_tags, viewing_tags.c.viewing_id == Viewing.id)\
+     .distinct().all()
+
+    media_by_year = {}
+    media_by_tag = {}
+    for year, media_id, tag_id in rows:
+        media_by_year.setdefault(int(year), set()).add(media_id)
+        if tag_id is not None:
+            media_by_tag.setdefault(tag_id, set()).add(media_id)
+
+    tags = Tag.query.filter(Tag.id.in_(media_by_tag)).order_by(Tag.name).all() if media_by_tag else []
+
+    return {
+        'years': [
+            {'year': year, 'count': len(media_by_year[year])}
+            for year in sorted(media_by_year, reverse=True)
+        ],
+        'tags': [
+            {'id': tag.id, 'name': tag.name, 'count': len(media_by_tag[tag.id])}
+            for tag in tags
+        ],
+    }
+
+
+class FacetCache:
+    """Keeps the last computed facets until the diary version moves on"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = None  # (version, computed_at, facets)
+
+    def get(self, ttl):
+        version = diary_version.value
+        now = time.time()
+        entry = self._entry
+        if entry and entry[0] == version and now - entry[1] < ttl:
+            return entry[2]
+
+        facets = compute_facets()
+        with self._lock:
+            self._entry = (version, now, facets)
+        return facets
+
+    def clear(self):
+        with self._lock:
+            self._entry = None
+
+
+facet_cache = FacetCache()
@@ -0,0 +1,82 @@
+import threading
+from flask import current_app, render_template
+from markupsafe import Markup
+from ..cache import MemoryCache, SQLiteCache, TieredCache
+from ..models import User
+from ..media.tmdb import tmdb_client
+from .queries import build_diary_items
+
+
+class CardCache:
+    """Rendered diary card HTML keyed by media id.
+
+    Each entry records the version it was rendered at (summary and media
+    timestamps, the diary's users and the image base URL), so a card that
+    another worker's write has changed is simply re-rendered. Writes in this
+    worker also drop their cards outright. Cards only need their viewings
+    loaded and the template run on a miss.
+    """
+
+    def __init__(self):
+        self.cache = None
+        self._lock = threading.Lock()
+
+    def _ensure_cache(self):
+        if self.cache is None:
+            with self._lock:
+                if self.cache is None:
+                    shared_path = current_app.config.get('DIARY_CARD_CACHE_PATH')
+                    self.cache = TieredCache(
+                        MemoryCache(current_app.config.get('DIARY_CARD_CACHE_SIZE', 2000)),
+                        SQLiteCache(shared_path) if shared_path else None,
+                    )
+        return self.cache
+
+    @staticmethod
+    def _key(media_id):
+        return f'diary-card:{media_id}'
+
+    @staticmethod
+    def _version(media, summary, users):
+        return [
+            summary.updated_at.isoformat() if summary.updated_at else None,
+            media.updated_at.isoformat() if media.updated_at else None,
+            [[user.id, user.username] for user in users],
+            tmdb_client.image_base_url,
+            bool(current_app.config.get('IMAGE_PROXY_ENABLED')),
+        ]
+
+    def render(self, media_list, summaries):
+        """Card HTML for each media item, in order, rendering only cache misses"""
+        cache = self._ensure_cache()
+        users = User.query.order_by(User.id).all()
+        ttl = current_app.config.get('DIARY_CARD_CACHE_TTL', 24 * 60 * 60)
+
+        cards = {}
+        misses = []
+        for media, summary in zip(media_list, summaries):
+            version = self._version(media, summary, users)
+            entry = cache.get(self._key(media.id))
+            if entry is not None and entry['v'] == version:
+                cards[media.id] = Markup(entry['html'])
+            else:
+                misses.append((media, summary, version))
+
+        if misses:
+            items = build_diary_items([m for m, _, _ in misses], [s for _, s, _ in misses], users)
+            for (media, _, version), item in zip(misses, items):
+                html = render_template('diary/_card.html', item=item)
+                cache.set(self._key(media.id), {'v': version, 'html': html}, ttl)
+                cards[media.id] = Markup(html)
+
+        return [cards[media.id] for media in media_list]
+
+    def invalidate(self, media_ids):
+        """Drop the cards of media whose diary data just changed"""
+        if self.cache is None:
+            return
+        for media_id in media_ids:
+            self.cache.delete(self._key(media_id))
+
+
+card_cache = CardCache()
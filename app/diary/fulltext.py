@@ -0,0 +1,159 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import cast, column, func, insert, literal_column, table, update
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import joinedload, selectinload
+from ..models import Media, MediaCast, Tag, Viewing, ViewingSearch, viewing_tags
+from ..extensions import db
+
+SEARCH_CONFIG = 'english'
+
+# The SQLite FTS5 index (see models.py); rowid is viewing_search.viewing_id
+viewing_search_fts = table('viewing_search_fts', column('rowid'))
+
+# Highlight delimiters; swapped for <mark> after the snippet is HTML-escaped
+_START, _STOP = '\x02', '\x03'
+
+
+def _document():
+    """Weighted tsvector over a viewing_search row: title, then tags and comment, then cast"""
+    config = cast(SEARCH_CONFIG, REGCONFIG)
+
+    def weighted(field, weight):
+        return func.setweight(func.to_tsvector(config, func.coalesce(field, '')), weight)
+
+    return weighted(ViewingSearch.title, 'A')\
+        .op('||')(weighted(ViewingSearch.tags, 'B'))\
+        .op('||')(weighted(ViewingSearch.comment, 'B'))\
+        .op('||')(weighted(ViewingSearch.cast_names, 'C'))
+
+
+def reindex_media(media_ids):
+    """Rewrite the search documents of every viewing of the given media.
+
+    Called inside the writing transaction, next to refresh_summaries(), so
+    the index commits together with the change it reflects.
+    """
+    media_ids = set(media_ids)
+    if not media_ids:
+        return
+
+    ViewingSearch.query.filter(ViewingSearch.media_id.in_(media_ids)).delete(synchronize_session=False)
+
+    viewings = db.session.query(Viewing.id, Viewing.media_id, Viewing.comment, Media.title)\
+                         .join(Media, Media.id == Viewing.media_id)\
+                         .filter(Viewing.media_id.in_(media_ids)).all()
+    if not viewings:
+        return
+
+    tags = {}
+    for viewing_id, name in db.session.query(viewing_tags.c.viewing_id, Tag.name)\
+                                      .join(Tag, Tag.id == viewing_tags.c.tag_id)\
+                                      .join(Viewing, Viewing.id == viewing_tags.c.viewing_id)\
+                                      .filter(Viewing.media_id.in_(media_ids)):
+        tags.setdefault(viewing_id, []).append(name)
+
+    cast_names = {}
+    for media_id, name in db.session.query(MediaCast.media_id, MediaCast.name)\
+                                    .filter(MediaCast.media_id.in_(media_ids))\
+                                    .order_by(MediaCast.media_id, MediaCast.position):
+        cast_names.setdefault(media_id, []).append(name)
+
+    db.session.execute(insert(ViewingSearch.__table__), [
+        {
+            'viewing_id': viewing.id,
+            'media_id': viewing.media_id,
+            'title': viewing.title,
+            'comment': viewing.comment,
+            'tags': ' '.join(sorted(tags.get(viewing.id, []))) or None,
+            'cast_names': ', '.join(cast_names.get(viewing.media_id, [])) or None,
+        }
+        for viewing in viewings
+    ])
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(update(ViewingSearch)
+                           .where(ViewingSearch.media_id.in_(media_ids))
+                           .values(document=_document()))
+
+
+def rebuild_search_index(batch_size=500):
+    """Reindex every viewing from scratch; returns the number of media"""
+    ViewingSearch.query.delete(synchronize_session=False)
+    media_ids = [row[0] for row in db.session.query(Viewing.media_id).distinct().order_by(Viewing.media_id)]
+    for start in range(0, len(media_ids), batch_size):
+        reindex_media(media_ids[start:start + batch_size])
+        db.session.commit()
+    db.session.commit()
+    return len(media_ids)
+
+
+def _fts5_query(q):
+    """Quote each word so user input can't be read as FTS5 syntax"""
+    words = re.findall(r'\w+', q)
+    return ' '.join('"%s"' % word for word in words)
+
+
+def _highlight(snippet):
+    return Markup(str(escape(snippet or '')).replace(_START, '<mark>').replace(_STOP, '</mark>'))
+
+
+def filter_viewings(query, filters):
+    """The diary's year/type/rating/tag filters, applied to each hit's viewing"""
+    if filters.get('media_type') in ['movie', 'tv']:
+        query = query.filter(Media.media_type == filters['media_type'])
+    if filters.get('year'):
+        query = query.filter(db.extract('year', Viewing.watched_on) == filters['year'])
+    if filters.get('rating') and 1 <= filters['rating'] <= 5:
+        query = query.filter(Viewing.rating >= filters['rating'])
+    if filters.get('tag'):
+        tagged = db.session.query(viewing_tags.c.viewing_id)\
+                           .join(Tag, Tag.id == viewing_tags.c.tag_id)\
+                           .filter(viewing_tags.c.viewing_id == Viewing.id, Tag.name == filters['tag'])
+        query = query.filter(tagged.exists())
+    return query
+
+
+def search_diary(q, filters, limit=50):
+    """Ranked diary viewings matching ``q``, each with a highlighted snippet.
+
+    Postgres matches websearch_to_tsquery() against the GIN-indexed
+    tsvector and ranks with ts_rank_cd(); SQLite matches the FTS5 table and
+    ranks with bm25(). Returns a list of ``{'viewing', 'media', 'snippet'}``.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        tsquery = func.websearch_to_tsquery(cast(SEARCH_CONFIG, REGCONFIG), q)
+        rank = func.ts_rank_cd(ViewingSearch.document, tsquery)
+        snippet = func.ts_headline(
+            cast(SEARCH_CONFIG, REGCONFIG),
+            func.concat_ws(' … ', ViewingSearch.comment, ViewingSearch.title,
+                           ViewingSearch.tags, ViewingSearch.cast_names),
+            tsquery,
+            f'StartSel="{_START}", StopSel="{_STOP}", MaxFragments=2, MaxWords=20, MinWords=5',
+        )
+        query = db.session.query(Viewing, Media, snippet)\
+                          .select_from(ViewingSearch)\
+                          .filter(ViewingSearch.document.op('@@')(tsquery))\
+                          .order_by(rank.desc(), Viewing.watched_on.desc())
+    else:
+        match = _fts5_query(q)
+        if not match:
+            return []
+        fts = literal_column('viewing_search_fts')
+        snippet = func.snippet(fts, -1, _START, _STOP, '…', 16)
+        query = db.session.query(Viewing, Media, snippet)\
+                          .select_from(ViewingSearch)\
+                          .join(viewing_search_fts, viewing_search_fts.c.rowid == ViewingSearch.viewing_id)\
+                          .filter(fts.op('MATCH')(match))\
+                          .order_by(func.bm25(fts, 10.0, 4.0, 4.0, 2.0), Viewing.watched_on.desc())
+
+    query = query.join(Viewing, Viewing.id == ViewingSearch.viewing_id)\
+                 .join(Media, Media.id == ViewingSearch.media_id)\
+                 .options(joinedload(Viewing.user), selectinload(Viewing.tags))
+    rows = filter_viewings(query, filters).limit(limit).all()
+
+    return [
+        {'viewing': viewing, 'media': media, 'snippet': _highlight(snippet)}
+        for viewing, media, snippet in rows
+    ]
@@ -0,0 +1,416 @@
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import insert, tuple_
+from ..cache import MemoryCache
+from ..extensions import db
+from ..models import Media, Viewing, viewing_tags
+from ..media.services import insert_media_ignoring_conflicts, media_values
+from ..media.tmdb import tmdb_client
+from .fulltext import reindex_media
+from .summary import refresh_summaries
+from .tags import parse_tag_names, resolve_tags
+from .versioning import diary_version
+from .fragments import card_cache
+
+IMDB_TV_TYPES = {'tvSeries', 'tvMiniSeries'}
+IMDB_MOVIE_TYPES = {'movie', 'tvMovie', 'video', 'tvSpecial', 'short', 'tvShort'}
+
+
+def detect_format(header):
+    """'letterboxd' or 'imdb' from a CSV header row, None if unrecognised"""
+    if 'Const' in header and 'Your Rating' in header:
+        return 'imdb'
+    if 'Name' in header and 'Year' in header:
+        return 'letterboxd'
+    return None
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+
+def _parse_year(value):
+    value = (value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def parse_letterboxd(row):
+    """One diary/ratings.csv row from a Letterboxd export (0.5-5 star ratings)"""
+    try:
+        stars = float(row.get('Rating') or 0)
+    except ValueError:
+        stars = 0
+    return {
+        'title': (row.get('Name') or '').strip(),
+        'year': _parse_year(row.get('Year')),
+        'media_type': 'movie',
+        'imdb_id': None,
+        'rating': min(5, int(stars + 0.5)) if stars else None,
+        'watched_on': _parse_date(row.get('Watched Date')) or _parse_date(row.get('Date')),
+        'rewatch': (row.get('Rewatch') or '').strip().lower() == 'yes',
+        'tags': parse_tag_names(row.get('Tags')),
+        'comment': (row.get('Review') or '').strip() or None,
+    }
+
+
+def parse_imdb(row):
+    """One row of an IMDb ratings export (1-10 ratings); episodes aren't importable"""
+    title_type = (row.get('Title Type') or '').strip()
+    if title_type in IMDB_TV_TYPES:
+        media_type = 'tv'
+    elif title_type in IMDB_MOVIE_TYPES or not title_type:
+        media_type = 'movie'
+    else:
+        return None
+    try:
+        score = int(row.get('Your Rating') or 0)
+    except ValueError:
+        score = 0
+    return {
+        'title': (row.get('Title') or '').strip(),
+        'year': _parse_year(row.get('Year')),
+        'media_type': media_type,
+        'imdb_id': (row.get('Const') or '').strip() or None,
+        'rating': (score + 1) // 2 if score else None,
+        'watched_on': _parse_date(row.get('Date Rated')),
+        'rewatch': False,
+        'tags': [],
+        'comment': None,
+    }
+
+
+PARSERS = {'letterboxd': parse_letterboxd, 'imdb': parse_imdb}
+
+
+class ImportStats:
+    """Running totals for one import; ``rows`` doubles as the resume checkpoint"""
+
+    FIELDS = ('rows', 'imported', 'duplicates', 'unresolved', 'skipped', 'new_media')
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field, 0))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class TitleResolver:
+    """Map parsed rows to (media_type, tmdb_id, TMDb result) with bounded concurrency.
+
+    Lookups are memoised in a bounded LRU so repeated titles in a long
+    history cost one TMDb call; the client's own response cache and rate
+    limiter sit underneath. A throttled or failed call is retried with
+    backoff before the row is counted as unresolved.
+    """
+
+    RETRIES = 4
+
+    def __init__(self, concurrency=4, memo_size=10000):
+        self.concurrency = concurrency
+        self.memo = MemoryCache(memo_size)
+
+    @staticmethod
+    def key(entry):
+        if entry['imdb_id']:
+            return f"imdb:{entry['imdb_id']}"
+        return f"{entry['media_type']}:{entry['title'].lower()}:{entry['year'] or ''}"
+
+    def resolve(self, entries):
+        """Return {key: match or None} for the distinct titles in ``entries``"""
+        pending = {}
+        matches = {}
+        for entry in entries:
+            key = self.key(entry)
+            if key in matches or key in pending:
+                continue
+            cached = self.memo.get(key)
+            if cached is not None:
+                matches[key] = cached.get('match')
+            else:
+                pending[key] = entry
+
+        if pending:
+            app = current_app._get_current_object()
+
+            def run(entry):
+                with app.app_context():
+                    return self._lookup(entry)
+
+            with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix='diary-import') as executor:
+                for key, match in zip(pending, executor.map(run, pending.values())):
+                    if match is not False:
+                        # A definite answer (even "no such title") is worth remembering
+                        self.memo.set(key, {'match': match}, 24 * 60 * 60)
+                    matches[key] = match or None
+        return matches
+
+    def _lookup(self, entry):
+        """A match, None when TMDb has no such title, or False if TMDb kept failing"""
+        for attempt in range(self.RETRIES):
+            if entry['imdb_id']:
+                response = tmdb_client.find_by_imdb_id(entry['imdb_id'])
+                results = response.get(f"{entry['media_type']}_results") if response else None
+            elif entry['media_type'] == 'tv':
+                response = tmdb_client.search_tv(entry['title'], year=entry['year'])
+                results = response.get('results') if response else None
+            else:
+                response = tmdb_client.search_movies(entry['title'], year=entry['year'])
+                results = response.get('results') if response else None
+
+            if response is not None:
+                return self._best(entry, results or [])
+            time.sleep(0.5 * 2 ** attempt)
+        return False
+
+    @staticmethod
+    def _best(entry, results):
+        if not results:
+            return None
+        title = entry['title'].lower()
+        exact = [r for r in results if (r.get('title') or r.get('name') or '').lower() == title]
+        result = (exact or results)[0]
+        return {'media_type': entry['media_type'], 'tmdb_id': result['id'], 'result': result}
+
+
+def _media_ids(matches):
+    """Ensure a Media row for every match; returns ({(tmdb_id, media_type): id}, inserted)"""
+    wanted = {(m['tmdb_id'], m['media_type']): m for m in matches}
+    if not wanted:
+        return {}, 0
+
+    def lookup():
+        return {
+            (tmdb_id, media_type): media_id
+            for media_id, tmdb_id, media_type in db.session.query(Media.id, Media.tmdb_id, Media.media_type)
+                                                         .filter(tuple_(Media.tmdb_id, Media.media_type).in_(list(wanted)))
+        }
+
+    ids = lookup()
+    missing = [key for key in wanted if key not in ids]
+    if not missing:
+        return ids, 0
+
+    rows = []
+    for tmdb_id, media_type in missing:
+        # Search results lack runtime/genres/cast: leave details_fetched_at
+        # empty so the stale-refresh path fetches full details later
+        values = media_values(wanted[(tmdb_id, media_type)]['result'])
+        values.update(tmdb_id=tmdb_id, media_type=media_type, details_fetched_at=None, title=values['title'] or '?')
+        rows.append(values)
+    inserted = insert_media_ignoring_conflicts(rows)
+    return lookup(), inserted
+
+
+def _import_chunk(entries, user_id, resolver, stats):
+    """Resolve, dedupe and insert one chunk of parsed rows in one transaction"""
+    matches = resolver.resolve(entries)
+    media_ids, stats_new = _media_ids([m for m in matches.values() if m])
+    stats.new_media += stats_new
+
+    resolved = []
+    for entry in entries:
+        match = matches.get(resolver.key(entry))
+        if not match:
+            stats.unresolved += 1
+            continue
+        resolved.append((media_ids[(match['tmdb_id'], match['media_type'])], entry))
+    if not resolved:
+        return set()
+
+    # Rows already in the diary (same user, title and day) are skipped, which
+    # also makes re-running an import harmless
+    chunk_media = {media_id for media_id, _ in resolved}
+    seen = set(db.session.query(Viewing.media_id, Viewing.watched_on)
+                         .filter(Viewing.user_id == user_id, Viewing.media_id.in_(chunk_media)))
+
+    rows, row_tags = [], []
+    for media_id, entry in resolved:
+        if (media_id, entry['watched_on']) in seen:
+            stats.duplicates += 1
+            continue
+        seen.add((media_id, entry['watched_on']))
+        rows.append({
+            'user_id': user_id,
+            'media_id': media_id,
+            'rating': entry['rating'],
+            'comment': entry['comment'],
+            'watched_on': entry['watched_on'],
+            'rewatch': entry['rewatch'],
+        })
+        row_tags.append(entry['tags'])
+    if not rows:
+        return set()
+
+    viewing_ids = db.session.execute(
+        insert(Viewing).returning(Viewing.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+
+    names = sorted({name for tags in row_tags for name in tags})
+    if names:
+        tag_ids = dict(zip(names, resolve_tags(names)))
+        links = [
+            {'viewing_id': viewing_id, 'tag_id': tag_ids[name]}
+            for viewing_id, tags in zip(viewing_ids, row_tags)
+            for name in tags
+        ]
+        db.session.execute(insert(viewing_tags), links)
+
+    stats.imported += len(rows)
+    touched = {row['media_id'] for row in rows}
+    refresh_summaries(touched)
+    reindex_media(touched)
+    return touched
+
+
+def import_diary(fh, user_id, fmt=None, batch_size=200, concurrency=4, stats=None, progress=None):
+    """Stream a Letterboxd or IMDb CSV export into ``user_id``'s diary.
+
+    Rows are read lazily and handled ``batch_size`` at a time, each batch in
+    its own transaction, so memory stays flat however long the file is.
+    Passing the ImportStats of an interrupted run resumes after its last
+    committed row. ``progress(stats)`` is called after every committed
+    batch. Returns the final ImportStats.
+    """
+    reader = csv.DictReader(fh)
+    fmt = fmt or detect_format(reader.fieldnames or [])
+    if fmt not in PARSERS:
+        raise ValueError('Unrecognised CSV export; expected a Letterboxd or IMDb file')
+    parse = PARSERS[fmt]
+
+    resolver = TitleResolver(concurrency)
+    stats = stats or ImportStats()
+    start_row = stats.rows
+    chunk = []
+
+    def flush():
+        try:
+            touched = _import_chunk(chunk, user_id, resolver, stats)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if touched:
+            diary_version.bump()
+            card_cache.invalidate(touched)
+        chunk.clear()
+
+    for index, row in enumerate(reader):
+        if index < start_row:
+            continue
+        stats.rows = index + 1
+        entry = parse(row)
+        if not entry or not entry['title'] or not entry['rating'] or not entry['watched_on']:
+            stats.skipped += 1
+        else:
+            chunk.append(entry)
+
+        if len(chunk) >= batch_size:
+            flush()
+            if progress:
+                progress(stats)
+
+    if chunk:
+        flush()
+    if progress:
+        progress(stats)
+    return stats
+
+
+class ImportJob:
+    """Progress file for an import, stored next to the uploaded CSV.
+
+    Written atomically after every batch, so any worker can report on a
+    job and an interrupted import resumes from its last committed row.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.status_path = path + '.status.json'
+
+    def read(self):
+        try:
+            with open(self.status_path) as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write(self, **status):
+        tmp = self.status_path + '.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(dict(status, updated_at=datetime.utcnow().isoformat()), fh)
+        os.replace(tmp, self.status_path)
+
+    def run(self, user_id, fmt=None, batch_size=200, concurrency=4, on_progress=None):
+        """Run (or resume) the import, recording progress as it goes"""
+        previous = self.read() or {}
+        if previous.get('state') == 'done':
+            return previous
+        stats = ImportStats(**{k: v for k, v in previous.items() if k in ImportStats.FIELDS})
+
+        def progress(stats):
+            self.write(state='running', **stats.as_dict())
+            if on_progress:
+                on_progress(stats)
+
+        self.write(state='running', **stats.as_dict())
+        try:
+            with open(self.path, newline='', encoding='utf-8-sig') as fh:
+                stats = import_diary(fh, user_id, fmt, batch_size, concurrency, stats, progress)
+        except Exception as e:
+            status = {k: v for k, v in (self.read() or {}).items() if k in ImportStats.FIELDS}
+            self.write(state='failed', error=str(e), **status)
+            raise
+        self.write(state='done', **stats.as_dict())
+        return self.read()
+
+    def reset(self):
+        """Forget progress so the next run starts from the first row"""
+        try:
+            os.remove(self.status_path)
+        except FileNotFoundError:
+            pass
+
+
+class DiaryImporter:
+    """Runs uploaded imports one at a time off the request path"""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, app, path, user_id, fmt=None):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='diary-import-job')
+        ImportJob(path).write(state='queued', **ImportStats().as_dict())
+        self._executor.submit(self._run, app, path, user_id, fmt)
+
+    @staticmethod
+    def _run(app, path, user_id, fmt):
+        with app.app_context():
+            try:
+                ImportJob(path).run(
+                    user_id, fmt,
+                    app.config.get('IMPORT_BATCH_SIZE', 200),
+                    app.config.get('IMPORT_CONCURRENCY', 4),
+                )
+            except Exception as e:
+                app.logger.error(f"Diary import {os.path.basename(path)} failed: {e}")
+            finally:
+                db.session.remove()
+
+
+diary_importer = DiaryImporter()
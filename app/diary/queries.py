@@ -0,0 +1,216 @@
+import base64
+import binascii
+import json
+from datetime import date
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import selectinload
+from ..models import Media, MediaDiarySummary, Viewing, User, Tag, viewing_tags
+from ..extensions import db
+
+
+def encode_cursor(direction, key):
+    """Opaque cursor for a page boundary; direction is 'next' or 'prev'"""
+    values = [v.isoformat() if isinstance(v, date) else v for v in key]
+    raw = json.dumps({'d': direction, 'k': values}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Return (direction, key) from a cursor, or (None, None) if it's invalid"""
+    if not cursor:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values = list(data['k'])
+        direction = data['d']
+        # Key layout: [max(rating),] max(watched_on), media.id
+        date_index = 1 if sort == 'highest_rated' else 0
+        if direction not in ('next', 'prev') or len(values) != date_index + 2:
+            return None, None
+        values = [
+            date.fromisoformat(value) if i == date_index else int(value)
+            for i, value in enumerate(values)
+        ]
+        return direction, tuple(values)
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None, None
+
+
+class DiaryPage:
+    """One keyset-paginated page of diary cards"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _apply_filters(query, filters):
+    """Restrict a query joined to Media and MediaDiarySummary to the diary filters.
+
+    Year, rating and tag must all hold for the same viewing, as they always
+    have; a rating filter on its own is answered from the summary's best
+    rating instead.
+    """
+    if filters.get('media_type') in ['movie', 'tv']:
+        query = query.filter(Media.media_type == filters['media_type'])
+
+    rating = filters.get('rating') if filters.get('rating') and 1 <= filters['rating'] <= 5 else None
+
+    if not filters.get('year') and not filters.get('tag'):
+        if rating:
+            query = query.filter(MediaDiarySummary.max_rating >= rating)
+        return query
+
+    matching = db.session.query(Viewing.id).filter(Viewing.media_id == Media.id)
+    if filters.get('year'):
+        matching = matching.filter(db.extract('year', Viewing.watched_on) == filters['year'])
+    if rating:
+        matching = matching.filter(Viewing.rating >= rating)
+    if filters.get('tag'):
+        matching = matching.join(viewing_tags, viewing_tags.c.viewing_id == Viewing.id)\
+                           .join(Tag, Tag.id == viewing_tags.c.tag_id)\
+                           .filter(Tag.name == filters['tag'])
+    return query.filter(matching.exists())
+
+
+def diary_page(filters, cursor=None, per_page=20, build_items=None):
+    """Load one page of diary cards with keyset (seek) pagination.
+
+    Pages are keyed on (last watched, media id), or on (best rating, last
+    watched, media id) for highest_rated, read straight from the indexed
+    media_diary_summary table, so no page needs an aggregate over every
+    viewing, an OFFSET scan or a COUNT. ``build_items(media_list,
+    summaries)`` turns the page's rows into items (build_diary_items by
+    default).
+    """
+    sort = filters.get('sort', 'newest')
+    if sort == 'highest_rated':
+        sort_columns = [MediaDiarySummary.max_rating, MediaDiarySummary.last_watched_on, MediaDiarySummary.media_id]
+    else:
+        sort_columns = [MediaDiarySummary.last_watched_on, MediaDiarySummary.media_id]
+
+    query = db.session.query(Media, MediaDiarySummary)\
+                      .join(MediaDiarySummary, MediaDiarySummary.media_id == Media.id)
+    query = _apply_filters(query, filters)
+
+    direction, key = decode_cursor(cursor, sort)
+    if direction == 'prev':
+        query = query.filter(tuple_(*sort_columns) > tuple_(*key))\
+                     .order_by(*[column.asc() for column in sort_columns])
+    else:
+        if key:
+            query = query.filter(tuple_(*sort_columns) < tuple_(*key))
+        query = query.order_by(*[column.desc() for column in sort_columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+
+    if not rows:
+        return DiaryPage([])
+
+    def sort_key(summary):
+        if sort == 'highest_rated':
+            return (summary.max_rating, summary.last_watched_on, summary.media_id)
+        return (summary.last_watched_on, summary.media_id)
+
+    first_key, last_key = sort_key(rows[0][1]), sort_key(rows[-1][1])
+    if direction == 'prev':
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, key is not None
+
+    return DiaryPage(
+        (build_items or build_diary_items)([media for media, _ in rows], [summary for _, summary in rows]),
+        next_cursor=encode_cursor('next', last_key) if has_next else None,
+        prev_cursor=encode_cursor('prev', first_key) if has_prev else None,
+    )
+
+
+def latest_viewings_by_media(summaries):
+    """Return {media_id: {user_id: Viewing}} holding each user's latest viewing.
+
+    The latest viewing ids come from the diary summary rows, so this is one
+    primary-key lookup plus one SELECT ... IN for their tags no matter how
+    many cards or users are on the page.
+    """
+    viewing_ids = [int(viewing_id) for summary in summaries for viewing_id in summary.user_latest.values()]
+    if not viewing_ids:
+        return {}
+
+    viewings = Viewing.query\
+        .filter(Viewing.id.in_(viewing_ids))\
+        .options(selectinload(Viewing.tags))\
+        .all()
+
+    latest = {}
+    for viewing in viewings:
+        latest.setdefault(viewing.media_id, {})[viewing.user_id] = viewing
+    return latest
+
+
+def build_diary_items(media_list, summaries, users=None):
+    """Build the per-card dicts rendered by diary/_cards.html.
+
+    Each item carries the media row, one ``(user, viewing)`` pair per diary
+    user (``viewing`` is None when that user hasn't watched it), the latest
+    viewing overall and the merged tags of every user's latest viewing.
+    """
+    if users is None:
+        users = User.query.order_by(User.id).all()
+
+    latest = latest_viewings_by_media(summaries)
+
+    items = []
+    for media in media_list:
+        by_user = latest.get(media.id, {})
+
+        # The overall latest viewing is always some user's latest viewing
+        latest_viewing = max(
+            by_user.values(),
+            key=lambda v: (v.watched_on, v.id),
+            default=None,
+        )
+
+        tags = []
+        for user in users:
+            viewing = by_user.get(user.id)
+            if viewing:
+                for tag in viewing.tags:
+                    if tag not in tags:
+                        tags.append(tag)
+
+        items.append({
+            'media': media,
+            'user_viewings': [(user, by_user.get(user.id)) for user in users],
+            'latest_viewing': latest_viewing,
+            'tags': tags,
+        })
+    return items
+
+
+def diary_data_version():
+    """Markers that change with any diary write: one round trip, no page queries.
+
+    Every viewing/tag write re-stamps its media's summary row, deletes drop
+    the row count, TMDb refreshes bump media.updated_at and new users add
+    rows to every card.
+    """
+    return list(db.session.query(
+        db.session.query(func.max(MediaDiarySummary.updated_at)).scalar_subquery(),
+        db.session.query(func.count(MediaDiarySummary.media_id)).scalar_subquery(),
+        db.session.query(func.max(Media.updated_at)).scalar_subquery(),
+        db.session.query(func.count(User.id)).scalar_subquery(),
+    ).one())
@@ -1,149 +1,128 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, make_response
+from flask import render_template, request, redirect, url_for, flash, jsonify, make_response, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
-from sqlalchemy import or_, and_, desc
+from sqlalchemy import or_, and_
 from . import bp
 from .forms import ViewingForm
-from ..models import Media, Viewing, Tag, User, viewing_tags
+from .queries import diary_page, diary_data_version
+from .summary import refresh_summaries
+from .fulltext import reindex_media, search_diary
+from .facets import facet_cache
+from .fragments import card_cache
+from .importer import ImportJob, diary_importer
+from .export import FORMATS, export_diary
+from .versioning import diary_version
+from .tags import parse_tag_names, resolve_tags, set_viewing_tags
+from .autocomplete import tag_index, suggest_trigram
+from ..models import Media, Viewing, Tag
 from ..extensions import db
+from ..media.services import get_or_create_media
+from ..media.images import image_url
 from ..media.tmdb import tmdb_client
+from ..conditional import conditional
+from ..database import read_replica
 from datetime import datetime, date
+import os
+import re
+import uuid
 
-def _parse_tag_names(raw: str) -> list[str]:
-    if not raw:
-        return []
-    names = [n.strip().lower() for n in raw.split(",")]
-    # drop empties and dedupe while preserving order
-    seen = set()
-    out = []
-    for n in names:
-        if n and n not in seen:
-            seen.add(n)
-            out.append(n)
-    return out
+DIARY_PAGE_SIZE = 20
+
+def _diary_filters():
+    """Diary filters and sort order from the query string"""
+    return {
+        'year': request.args.get('year', type=int),
+        'media_type': request.args.get('media_type'),
+        'rating': request.args.get('rating', type=int),
+        'tag': request.args.get('tags'),
+        'sort': request.args.get('sort', 'newest'),
+    }
+
+def _diary_validator():
+    """Conditional-request validator shared by the diary views"""
+    return diary_data_version() + [tmdb_client.image_base_url]
+
+def _template_filters(filters):
+    """Filters in the shape list.html uses for selects and links"""
+    return {
+        'year': filters['year'],
+        'media_type': filters['media_type'],
+        'rating': filters['rating'],
+        'tags': [filters['tag']] if filters['tag'] else [],
+        'sort': filters['sort']
+    }
 
 @bp.route('/diary/me')
 @login_required
+@read_replica
+@conditional(_diary_validator)
 def my_diary():
     """Show shared diary (all viewings from both users)"""
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
-    
-    # Get distinct media IDs to build the diary around unique movies/shows
-    media_query = db.session.query(Media.id).join(Viewing)
-    
-    # Filter by year
-    year_filter = request.args.get('year', type=int)
-    if year_filter:
-        media_query = media_query.filter(db.extract('year', Viewing.watched_on) == year_filter)
-    
-    # Filter by media type
-    media_type_filter = request.args.get('media_type')
-    if media_type_filter in ['movie', 'tv']:
-        media_query = media_query.filter(Media.media_type == media_type_filter)
-    
-    # Filter by rating
-    rating_filter = request.args.get('rating', type=int)
-    if rating_filter and 1 <= rating_filter <= 5:
-        media_query = media_query.filter(Viewing.rating >= rating_filter)
-    
-    # Filter by tags
-    tag_filter = request.args.get('tags')
-    if tag_filter:
-        media_query = media_query.join(viewing_tags).join(Tag).filter(Tag.name == tag_filter)
-    
-    # Get unique media IDs
-    media_ids_subquery = media_query.distinct().subquery()
-    
-    # Get media records with their latest viewing for ordering
-    media_query = db.session.query(Media)\
-                           .join(media_ids_subquery, Media.id == media_ids_subquery.c.id)\
-                           .join(Viewing)\
-                           .group_by(Media.id)
-    
-    # Sort
-    sort_by = request.args.get('sort', 'newest')
-    if sort_by == 'highest_rated':
-        media_query = media_query.order_by(desc(db.func.max(Viewing.rating)), desc(db.func.max(Viewing.watched_on)))
-    else:  # newest
-        media_query = media_query.order_by(desc(db.func.max(Viewing.watched_on)))
-    
-    media_pagination = media_query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    # Get both users' viewings for each media item
-    alex_user = User.query.filter_by(username='alex').first()
-    carrie_user = User.query.filter_by(username='carrie').first()
-    
-    media_items = []
-    for media in media_pagination.items:
-        alex_viewing = None
-        carrie_viewing = None
-        latest_viewing = None
-        
-        if alex_user:
-            alex_viewing = Viewing.query.filter(
-                Viewing.user_id == alex_user.id,
-                Viewing.media_id == media.id
-            ).order_by(Viewing.watched_on.desc()).first()
-        
-        if carrie_user:
-            carrie_viewing = Viewing.query.filter(
-                Viewing.user_id == carrie_user.id,
-                Viewing.media_id == media.id
-            ).order_by(Viewing.watched_on.desc()).first()
-        
-        # Get the latest viewing overall for date display
-        latest_viewing = Viewing.query.filter(
-            Viewing.media_id == media.id
-        ).order_by(Viewing.watched_on.desc()).first()
-        
-        media_items.append({
-            'media': media,
-            'alex_viewing': alex_viewing,
-            'carrie_viewing': carrie_viewing,
-            'latest_viewing': latest_viewing
-        })
-    
-    # Create a pagination-like object for the template
-    class MediaPagination:
-        def __init__(self, items, pagination):
-            self.items = items
-            self.page = pagination.page
-            self.pages = pagination.pages
-            self.has_prev = pagination.has_prev
-            self.has_next = pagination.has_next
-            self.prev_num = pagination.prev_num
-            self.next_num = pagination.next_num
-            
-        def iter_pages(self):
-            return range(1, self.pages + 1)
-    
-    media_viewings = MediaPagination(media_items, media_pagination)
-    
-    # Get available years and tags for filters
-    years = db.session.query(db.extract('year', Viewing.watched_on).label('year'))\
-                     .distinct()\
-                     .order_by(desc('year')).all()
-    
-    user_tags = db.session.query(Tag)\
-                          .join(viewing_tags)\
-                          .join(Viewing)\
-                          .distinct().all()
+    filters = _diary_filters()
+    
+    # Keyset pagination: each page costs the same no matter how deep it is
+    media_viewings = diary_page(filters, request.args.get('cursor'), DIARY_PAGE_SIZE, card_cache.render)
+    
+    # Year/tag filter options with counts, cached until the next diary write
+    facets = facet_cache.get(current_app.config.get('DIARY_FACET_TTL', 60))
     
     return render_template('diary/list.html', 
                          viewings=media_viewings, 
-                         years=[y[0] for y in years],
-                         tags=user_tags,
-                         current_filters={
-                             'year': year_filter,
-                             'media_type': media_type_filter,
-                             'rating': rating_filter,
-                             'tags': [tag_filter] if tag_filter else [],
-                             'sort': sort_by
-                         },
+                         years=facets['years'],
+                         tags=facets['tags'],
+                         current_filters=_template_filters(filters),
                          page_title="Our Diary")
 
+@bp.route('/diary/me/cards')
+@login_required
+@read_replica
+@conditional(_diary_validator)
+def diary_cards():
+    """Next batch of diary cards for infinite scroll (HTMX partial)"""
+    filters = _diary_filters()
+    media_viewings = diary_page(filters, request.args.get('cursor'), DIARY_PAGE_SIZE, card_cache.render)
+    
+    return render_template('diary/_cards.html',
+                         viewings=media_viewings,
+                         current_filters=_template_filters(filters))
+
+@bp.route('/diary/search')
+@login_required
+@read_replica
+@conditional(_diary_validator)
+def search():
+    """Full-text search over diary comments, titles, tags and cast"""
+    q = request.args.get('q', '').strip()
+    filters = _diary_filters()
+    
+    hits = search_diary(q, filters, current_app.config.get('DIARY_SEARCH_LIMIT', 50)) if q else []
+    
+    template = 'diary/_search_results.html' if request.headers.get('HX-Request') else 'diary/search.html'
+    return render_template(template,
+                         q=q,
+                         hits=hits,
+                         current_filters=_template_filters(filters),
+                         page_title="Search Our Diary")
+
+@bp.route('/diary/export')
+@login_required
+def export():
+    """Download the diary (with the current filters) as CSV or NDJSON"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return "Unknown export format", 400
+    compress = request.args.get('gzip') == '1'
+    filters = _diary_filters()
+    
+    # Streamed straight from a server-side cursor; nothing is built up in memory
+    chunks = export_diary(filters, fmt, compress, current_app.config.get('DIARY_EXPORT_BATCH_SIZE', 1000))
+    mimetype, extension = FORMATS[fmt]
+    filename = f"diary-{date.today().isoformat()}.{extension}" + ('.gz' if compress else '')
+    
+    response = Response(stream_with_context(chunks), mimetype='application/gzip' if compress else mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @bp.route('/diary/together')
 @login_required
 def together_diary():
@@ -154,39 +133,13 @@ def together_diary():
 @login_required
 def add_viewing_modal(media_type, tmdb_id):
     """Show add viewing modal (HTMX partial)"""
-    # Get or create media record
-    media = Media.query.filter_by(tmdb_id=tmdb_id, media_type=media_type).first()
+    if media_type not in ('movie', 'tv'):
+        return "Invalid media type", 400
     
+    # Get or create media record
+    media = get_or_create_media(media_type, tmdb_id)
     if not media:
-        # Fetch from TMDb
-        if media_type == 'movie':
-            details = tmdb_client.get_movie_details(tmdb_id)
-        elif media_type == 'tv':
-            details = tmdb_client.get_tv_details(tmdb_id)
-        else:
-            return "Invalid media type", 400
-        
-        if not details:
-            return "Media not found", 404
-        
-        media = Media(
-            tmdb_id=tmdb_id,
-            media_type=media_type,
-            title=details.get('title') or details.get('name'),
-            release_year=None,
-            poster_path=details.get('poster_path'),
-            backdrop_path=details.get('backdrop_path'),
-            cached_json=details
-        )
-        
-        # Extract year
-        if 'release_date' in details and details['release_date']:
-            media.release_year = int(details['release_date'][:4])
-        elif 'first_air_date' in details and details['first_air_date']:
-            media.release_year = int(details['first_air_date'][:4])
-        
-        db.session.add(media)
-        db.session.commit()
+        return "Media not found", 404
     
     form = ViewingForm()
     form.tmdb_id.data = tmdb_id
@@ -195,7 +148,7 @@ def add_viewing_modal(media_type, tmdb_id):
     # Get all available tags for selection
     available_tags = Tag.query.order_by(Tag.name).all()
     
-    poster_url = tmdb_client.build_image_url(media.poster_path, 'w342')
+    poster_url = image_url(media.poster_path, 'w342')
     
     return render_template('components/_add_viewing_modal.html', 
                          form=form, 
@@ -235,15 +188,13 @@ def create_viewing():
         
         # Handle tags
         if form.tags.data:
-            tag_names = _parse_tag_names(form.tags.data)
-            for tag_name in tag_names:
-                tag = Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                    db.session.add(tag)
-                viewing.tags.append(tag)
+            set_viewing_tags(viewing, resolve_tags(parse_tag_names(form.tags.data)))
         
+        refresh_summaries([media.id])
+        reindex_media([media.id])
         db.session.commit()
+        diary_version.bump()
+        card_cache.invalidate([media.id])
         flash(f'Added viewing for {media.title}!', 'success')
         
         # If HTMX request, return a response that triggers modal close and page refresh
@@ -263,9 +214,8 @@ def create_viewing():
         ).first()
         
         if media:
-            from ..media.tmdb import tmdb_client
             available_tags = Tag.query.order_by(Tag.name).all()
-            poster_url = tmdb_client.build_image_url(media.poster_path, 'w342')
+            poster_url = image_url(media.poster_path, 'w342')
             return render_template('components/_add_viewing_modal.html', 
                                  form=form, 
                                  media=media,
@@ -305,7 +255,7 @@ def edit_viewing_modal(viewing_id):
     # Get all available tags for selection
     available_tags = Tag.query.order_by(Tag.name).all()
     
-    poster_url = tmdb_client.build_image_url(media.poster_path, 'w342')
+    poster_url = image_url(media.poster_path, 'w342')
     
     return render_template('components/_edit_viewing_modal.html', 
                          form=form, 
@@ -335,23 +285,14 @@ def update_viewing(viewing_id):
         viewing.watched_on = form.watched_on.data
         viewing.rewatch = form.rewatch.data
         
-        # Clear existing tags
-        viewing.tags = []
-        
-        # Handle new tags
-        if form.tags.data:
-            tag_names = _parse_tag_names(form.tags.data)
-            
-            # Get or create each tag
-            for tag_name in tag_names:
-                tag = Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                    db.session.add(tag)
-                viewing.tags.append(tag)
-        
         try:
+            # Apply only the difference between the old and new tag sets
+            set_viewing_tags(viewing, resolve_tags(parse_tag_names(form.tags.data)))
+            refresh_summaries([viewing.media_id])
+            reindex_media([viewing.media_id])
             db.session.commit()
+            diary_version.bump()
+            card_cache.invalidate([viewing.media_id])
             flash(f'Updated viewing for {viewing.media.title}!', 'success')
             # If HTMX request, trigger refresh
             if request.headers.get('HX-Request'):
@@ -367,7 +308,7 @@ def update_viewing(viewing_id):
     if request.headers.get('HX-Request'):
         media = viewing.media
         available_tags = Tag.query.order_by(Tag.name).all()
-        poster_url = tmdb_client.build_image_url(media.poster_path, 'w342')
+        poster_url = image_url(media.poster_path, 'w342')
         return render_template('components/_edit_viewing_modal.html', 
                              form=form, 
                              media=media,
@@ -391,7 +332,46 @@ def tags_autocomplete():
     if not q:
         return jsonify([])
     
-    tags = Tag.query.filter(Tag.name.ilike(f'%{q}%')).limit(10).all()
-    suggestions = [{'name': tag.name} for tag in tags]
+    if current_app.config.get('TAG_AUTOCOMPLETE_MODE') == 'trigram' and db.engine.dialect.name == 'postgresql':
+        suggestions = suggest_trigram(q)
+    else:
+        suggestions = tag_index.suggest(q, ttl=current_app.config.get('TAG_AUTOCOMPLETE_TTL', 60))
     
     return jsonify(suggestions)
+
+
+def _import_path(job_id):
+    return os.path.join(current_app.config['IMPORT_DIR'], f'{job_id}.csv')
+
+@bp.route('/diary/import', methods=['GET', 'POST'])
+@login_required
+def import_history():
+    """Upload a Letterboxd or IMDb CSV export to import in the background"""
+    if request.method == 'GET':
+        return render_template('diary/import.html', page_title="Import History")
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV file to import', 'error')
+        return redirect(url_for('diary.import_history'))
+    
+    # Streamed to disk in chunks; the import then reads it row by row
+    job_id = uuid.uuid4().hex
+    os.makedirs(current_app.config['IMPORT_DIR'], exist_ok=True)
+    upload.save(_import_path(job_id))
+    diary_importer.submit(current_app._get_current_object(), _import_path(job_id), current_user.id)
+    
+    return redirect(url_for('diary.import_status', job_id=job_id))
+
+@bp.route('/diary/import/<job_id>')
+@login_required
+def import_status(job_id):
+    """Progress of an upload import (full page, or the polled HTMX partial)"""
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return "Import not found", 404
+    status = ImportJob(_import_path(job_id)).read()
+    if status is None:
+        return "Import not found", 404
+    
+    template = 'diary/_import_status.html' if request.headers.get('HX-Request') else 'diary/import.html'
+    return render_template(template, job_id=job_id, status=status, page_title="Import History")
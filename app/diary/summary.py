@@ -0,0 +1,85 @@
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from ..models import Viewing, MediaDiarySummary, viewing_tags
+from ..extensions import db
+
+
+def _upsert(rows):
+    """INSERT ... ON CONFLICT (media_id) DO UPDATE for summary rows"""
+    dialect = db.engine.dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        for row in rows:
+            db.session.merge(MediaDiarySummary(**row))
+        return
+
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert(MediaDiarySummary).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['media_id'],
+        set_={column: stmt.excluded[column] for column in rows[0] if column != 'media_id'},
+    )
+    db.session.execute(stmt)
+
+
+def refresh_summaries(media_ids):
+    """Recompute the diary summary rows for the given media.
+
+    Called inside the writing transaction (after the viewing change is
+    flushed) so the summary commits together with the change it reflects.
+    Media left without viewings lose their summary row.
+    """
+    media_ids = set(media_ids)
+    if not media_ids:
+        return
+
+    viewings = db.session.query(
+        Viewing.id, Viewing.media_id, Viewing.user_id, Viewing.watched_on, Viewing.rating
+    ).filter(Viewing.media_id.in_(media_ids))\
+     .order_by(Viewing.watched_on.desc(), Viewing.id.desc())\
+     .all()
+
+    tag_pairs = db.session.query(Viewing.media_id, viewing_tags.c.tag_id)\
+                          .join(viewing_tags, viewing_tags.c.viewing_id == Viewing.id)\
+                          .filter(Viewing.media_id.in_(media_ids))\
+                          .distinct().all()
+    tags_by_media = {}
+    for media_id, tag_id in tag_pairs:
+        tags_by_media.setdefault(media_id, set()).add(tag_id)
+
+    now = datetime.utcnow()
+    summaries = {}
+    # Viewings arrive newest first, so the first one seen per key is the latest
+    for viewing in viewings:
+        summary = summaries.get(viewing.media_id)
+        if summary is None:
+            summary = summaries[viewing.media_id] = {
+                'media_id': viewing.media_id,
+                'last_watched_on': viewing.watched_on,
+                'max_rating': viewing.rating,
+                'viewing_count': 0,
+                'latest_viewing_id': viewing.id,
+                'user_latest': {},
+                'tag_ids': sorted(tags_by_media.get(viewing.media_id, ())),
+                'updated_at': now,
+            }
+        summary['viewing_count'] += 1
+        summary['max_rating'] = max(summary['max_rating'], viewing.rating)
+        summary['user_latest'].setdefault(str(viewing.user_id), viewing.id)
+
+    emptied = media_ids - set(summaries)
+    if emptied:
+        MediaDiarySummary.query.filter(MediaDiarySummary.media_id.in_(emptied))\
+                               .delete(synchronize_session=False)
+    if summaries:
+        _upsert(list(summaries.values()))
+
+
+def rebuild_summaries(batch_size=500):
+    """Rebuild every summary row from scratch; returns the number of media"""
+    MediaDiarySummary.query.delete(synchronize_session=False)
+    media_ids = [row[0] for row in db.session.query(Viewing.media_id).distinct().order_by(Viewing.media_id)]
+    for start in range(0, len(media_ids), batch_size):
+        refresh_summaries(media_ids[start:start + batch_size])
+        db.session.commit()
+    db.session.commit()
+    return len(media_ids)
@@ -0,0 +1,89 @@
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from ..models import Tag, viewing_tags
+from ..extensions import db
+
+
+def parse_tag_names(raw):
+    """Lower-cased tag names from a comma-separated string, without empties or
+    repeats (first occurrence wins)"""
+    if not raw:
+        return []
+    names = [n.strip().lower() for n in raw.split(",")]
+    # drop empties and dedupe while preserving order
+    seen = set()
+    out = []
+    for n in names:
+        if n and n not in seen:
+            seen.add(n)
+            out.append(n)
+    return out
+
+
+def _insert_missing(names):
+    """Insert tags that don't exist yet; returns {name: id} for the rows this call created"""
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert_(Tag).values([{'name': name} for name in names])\
+                           .on_conflict_do_nothing(index_elements=['name'])\
+                           .returning(Tag.name, Tag.id)
+        return dict(db.session.execute(stmt).all())
+
+    # Backends without ON CONFLICT: one savepoint per name
+    created = {}
+    for name in names:
+        try:
+            with db.session.begin_nested():
+                created[name] = db.session.execute(insert(Tag).values(name=name)).inserted_primary_key[0]
+        except IntegrityError:
+            pass
+    return created
+
+
+def resolve_tags(names):
+    """Return tag ids for ``names`` (in order), creating any that are missing.
+
+    One IN query finds the existing tags and one INSERT ... ON CONFLICT DO
+    NOTHING RETURNING creates the rest. Names another transaction created
+    in the meantime are picked up by a final lookup instead of failing on
+    tags.name uniqueness.
+    """
+    if not names:
+        return []
+
+    ids = dict(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(names)).all())
+
+    missing = [name for name in names if name not in ids]
+    if missing:
+        ids.update(_insert_missing(missing))
+        raced = [name for name in missing if name not in ids]
+        if raced:
+            ids.update(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(raced)).all())
+
+    return [ids[name] for name in names]
+
+
+def set_viewing_tags(viewing, tag_ids):
+    """Make ``viewing``'s tags exactly ``tag_ids``, touching only the rows that change"""
+    current = set(db.session.execute(
+        select(viewing_tags.c.tag_id).where(viewing_tags.c.viewing_id == viewing.id)
+    ).scalars())
+    wanted = set(tag_ids)
+
+    removed = current - wanted
+    if removed:
+        db.session.execute(delete(viewing_tags).where(
+            viewing_tags.c.viewing_id == viewing.id,
+            viewing_tags.c.tag_id.in_(removed),
+        ))
+
+    added = wanted - current
+    if added:
+        db.session.execute(insert(viewing_tags), [
+            {'viewing_id': viewing.id, 'tag_id': tag_id} for tag_id in added
+        ])
+
+    # The ORM collection no longer matches the table
+    db.session.expire(viewing, ['tags'])
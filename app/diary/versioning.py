@@ -0,0 +1,27 @@
+import threading
+
+
+class DiaryVersion:
+    """In-process counter bumped after every committed diary write.
+
+    Caches of data derived from viewings and tags store the version they
+    were computed at and treat any other value as a miss. Other workers'
+    writes don't bump this process's counter, so such caches also carry a
+    short TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+
+    @property
+    def value(self):
+        return self._value
+
+    def bump(self):
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+diary_version = DiaryVersion()
@@ -1,16 +1,20 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate
+import os
 from flask_wtf.csrf import CSRFProtect
+from .database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
-migrate = Migrate()
 csrf = CSRFProtect()
 
 def init_extensions(app):
     db.init_app(app)
-    migrate.init_app(app, db)
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        # `flask db ...` only exists on the command line; importing
+        # Flask-Migrate (and Alembic) would otherwise slow every worker boot
+        from flask_migrate import Migrate
+        Migrate(app, db)
     csrf.init_app(app)
     
     login_manager.init_app(app)
@@ -0,0 +1,185 @@
+import cProfile
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .metrics import registry
+
+# The stats of the request being handled; worker threads doing work for a
+# request (e.g. parallel TMDb searches) run in a copy of its context
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Per-request totals: SQL queries, TMDb calls and TMDb cache hits"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.tmdb_calls = 0
+        self.tmdb_seconds = 0.0
+        self.tmdb_cache_hits = 0
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+    def add_tmdb_call(self, seconds):
+        with self._lock:
+            self.tmdb_calls += 1
+            self.tmdb_seconds += seconds
+
+    def add_tmdb_cache_hit(self):
+        with self._lock:
+            self.tmdb_cache_hits += 1
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        return {
+            'ms': round(self.elapsed * 1000, 1),
+            'db_queries': self.db_queries,
+            'db_ms': round(self.db_seconds * 1000, 1),
+            'tmdb_calls': self.tmdb_calls,
+            'tmdb_ms': round(self.tmdb_seconds * 1000, 1),
+            'tmdb_cache_hits': self.tmdb_cache_hits,
+        }
+
+
+def current_stats():
+    """Stats of the request in progress, or None outside a request"""
+    return _current.get()
+
+
+def record_tmdb_call(seconds, status='error'):
+    registry.observe('tmdb_request_duration_seconds', seconds, status=str(status))
+    stats = _current.get()
+    if stats is not None:
+        stats.add_tmdb_call(seconds)
+
+
+def record_tmdb_cache_hit():
+    stats = _current.get()
+    if stats is not None:
+        stats.add_tmdb_cache_hit()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.add_query(time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def server_timing(stats):
+    """Server-Timing header value for a request's stats"""
+    return ', '.join([
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_queries} queries"',
+        f'tmdb;dur={stats.tmdb_seconds * 1000:.1f};desc="{stats.tmdb_calls} calls, {stats.tmdb_cache_hits} cache hits"',
+        f'app;dur={stats.elapsed * 1000:.1f}',
+    ])
+
+
+def _start_request():
+    g.request_stats = RequestStats()
+    g.request_stats_token = _current.set(g.request_stats)
+
+    rate = current_app.config.get('PROFILE_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another request in this process is already being profiled
+            return
+        g.profiler = profiler
+
+
+def _finish_request(response):
+    stats = g.get('request_stats')
+    if stats is None:
+        return response
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _save_profile(profiler, stats)
+
+    if current_app.config.get('SERVER_TIMING_ENABLED', True):
+        response.headers['Server-Timing'] = server_timing(stats)
+
+    threshold = current_app.config.get('SLOW_REQUEST_MS', 500)
+    if threshold and stats.elapsed * 1000 >= threshold:
+        current_app.logger.warning(json.dumps(dict(
+            event='slow_request',
+            method=request.method,
+            path=request.path,
+            endpoint=request.endpoint,
+            status=response.status_code,
+            **stats.as_dict(),
+        )))
+    return response
+
+
+def _save_profile(profiler, stats):
+    """Write a sampled request's cProfile stats for `python -m pstats` / snakeviz"""
+    directory = current_app.config.get('PROFILE_DIR')
+    try:
+        os.makedirs(directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unknown'}-{stats.elapsed * 1000:.0f}ms-{os.getpid()}.prof"
+        profiler.dump_stats(os.path.join(directory, name))
+    except OSError as e:
+        current_app.logger.error(f"Could not save request profile: {e}")
+
+
+def _end_request(exception=None):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        # after_request didn't run (unhandled error)
+        profiler.disable()
+    token = g.pop('request_stats_token', None)
+    if token is not None:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Torn down from a different context (e.g. a streamed response)
+            _current.set(None)
+
+
+def init_app(app):
+    """Count queries on every engine and time each request.
+
+    Adds a Server-Timing header (DB, TMDb and total time), logs requests
+    slower than SLOW_REQUEST_MS as one JSON line and, when
+    PROFILE_SAMPLE_RATE is set, saves a cProfile dump for that fraction of
+    requests under PROFILE_DIR.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
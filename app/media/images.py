@@ -0,0 +1,228 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+import requests
+from flask import current_app, url_for
+from .singleflight import SingleFlight
+from .tmdb import tmdb_client
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow missing: serve TMDb's own sizes, no WebP
+    Image = None
+
+# Sizes TMDb renders itself; anything else is resized locally from the next
+# larger one (which needs Pillow)
+NATIVE_SIZES = ('w45', 'w92', 'w154', 'w185', 'w300', 'w342', 'w500', 'w780', 'w1280', 'h632', 'original')
+
+# Raster formats only: an upstream SVG served from our origin could run script
+_FILENAME = re.compile(r'^[A-Za-z0-9_-]+\.(jpg|jpeg|png)$')
+
+_MIMETYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'webp': 'image/webp',
+}
+
+
+class ImageUnavailable(Exception):
+    """The upstream image host couldn't supply an image"""
+
+
+class ImageStore:
+    """Content-addressed image files on disk with size-bounded LRU eviction.
+
+    Image bytes live in ``blobs/<sha256>.<ext>`` and each requested variant
+    (path, size, format) points at its blob through a small file under
+    ``variants/``, so identical images are stored once and the blob name
+    doubles as a strong ETag. Every worker on the host shares the directory;
+    a hit bumps the blob's mtime (at most hourly) and the least recently
+    used blobs are deleted once the total passes ``max_bytes``.
+    """
+
+    TOUCH_INTERVAL = 60 * 60
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._written = max_bytes  # sweep after the first write
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'variants'), exist_ok=True)
+
+    def _variant_path(self, key):
+        return os.path.join(self.root, 'variants', hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def blob_path(self, digest, ext):
+        return os.path.join(self.root, 'blobs', f'{digest}.{ext}')
+
+    def _write_atomic(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        """Return (digest, ext) for a stored variant, or None"""
+        try:
+            with open(self._variant_path(key)) as fh:
+                digest, ext = fh.read().split('.')
+            path = self.blob_path(digest, ext)
+            if time.time() - os.stat(path).st_mtime > self.TOUCH_INTERVAL:
+                os.utime(path)
+            return digest, ext
+        except (FileNotFoundError, ValueError):
+            # Never stored, or the blob was evicted
+            return None
+
+    def put(self, key, data, ext):
+        """Store a variant's bytes; returns (digest, ext)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest, ext)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+        self._write_atomic(self._variant_path(key), f'{digest}.{ext}'.encode('ascii'))
+
+        with self._lock:
+            self._written += len(data)
+            sweep = self._written >= self.max_bytes // 10
+            if sweep:
+                self._written = 0
+        if sweep:
+            self.evict()
+        return digest, ext
+
+    def evict(self):
+        """Delete least recently used blobs until the cache fits in max_bytes"""
+        blobs = []
+        total = 0
+        with os.scandir(os.path.join(self.root, 'blobs')) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        # Evict down to 90% so the next few writes don't each trigger a sweep
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(blobs):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class ImageProxy:
+    """Fetches TMDb images once and serves them from the local ImageStore"""
+
+    def __init__(self):
+        self.store = None
+        self.inflight = SingleFlight()
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+
+    def _ensure_store(self):
+        if self.store is None:
+            with self._lock:
+                if self.store is None:
+                    self.store = ImageStore(
+                        current_app.config.get('IMAGE_CACHE_DIR'),
+                        current_app.config.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+                    )
+        return self.store
+
+    @staticmethod
+    def allowed(size, filename):
+        if size not in current_app.config.get('IMAGE_PROXY_SIZES', NATIVE_SIZES) or not _FILENAME.match(filename):
+            return False
+        # Sizes TMDb doesn't render are only available when we can resize
+        return size in NATIVE_SIZES or (Image is not None and bool(re.match(r'^w\d+$', size)))
+
+    @staticmethod
+    def wants_webp(accept, filename):
+        return (Image is not None
+                and current_app.config.get('IMAGE_PROXY_WEBP')
+                and 'image/webp' in (accept or ''))
+
+    def upstream_url(self, size, filename):
+        base = current_app.config.get('TMDB_IMAGE_BASE_URL', 'https://image.tmdb.org/t/p').rstrip('/')
+        return f'{base}/{size}/{filename}'
+
+    def get(self, size, filename, webp=False):
+        """Return (file path, digest, mimetype) for a variant, fetching it on a miss"""
+        store = self._ensure_store()
+        key = f'{size}/{filename}' + ('.webp' if webp else '')
+        stored = store.get(key)
+        if stored is None:
+            stored = self.inflight.do(key, self._fetch, store, key, size, filename, webp)
+        digest, ext = stored
+        return store.blob_path(digest, ext), digest, _MIMETYPES[ext]
+
+    def _source_size(self, size):
+        """TMDb size to download for ``size``: itself, or the next larger width"""
+        if size in NATIVE_SIZES:
+            return size
+        width = int(size[1:])
+        for native in NATIVE_SIZES:
+            if native.startswith('w') and int(native[1:]) >= width:
+                return native
+        return 'original'
+
+    def _fetch(self, store, key, size, filename, webp):
+        # Another request may have stored it while this one waited to lead
+        stored = store.get(key)
+        if stored is not None:
+            return stored
+
+        try:
+            response = self.session.get(self.upstream_url(self._source_size(size), filename), timeout=10)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise ImageUnavailable(str(e)) from e
+
+        data = response.content
+        ext = filename.rsplit('.', 1)[1].lower()
+        if Image is not None and (webp or size not in NATIVE_SIZES):
+            data, ext = self._transcode(data, ext, size, webp)
+        return store.put(key, data, ext)
+
+    @staticmethod
+    def _transcode(data, ext, size, webp):
+        image = Image.open(io.BytesIO(data))
+        if size.startswith('w') and size not in NATIVE_SIZES and image.width > int(size[1:]):
+            width = int(size[1:])
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+        out = io.BytesIO()
+        if webp:
+            image.save(out, 'WEBP', quality=current_app.config.get('IMAGE_PROXY_WEBP_QUALITY', 80))
+            return out.getvalue(), 'webp'
+        if ext == 'png':
+            image.save(out, 'PNG')
+        else:
+            image.convert('RGB').save(out, 'JPEG', quality=90)
+        return out.getvalue(), ext
+
+
+def image_url(path, size='w500'):
+    """URL for a TMDb image path: the local proxy when enabled (and it can
+    serve the file), else TMDb's CDN"""
+    if not path:
+        return None
+    filename = path.lstrip('/')
+    if current_app.config.get('IMAGE_PROXY_ENABLED') and ImageProxy.allowed(size, filename):
+        return url_for('media.image', size=size, filename=filename)
+    return tmdb_client.build_image_url(path, size)
+
+
+image_proxy = ImageProxy()
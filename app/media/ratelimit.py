@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to per-process limiting
+    fcntl = None
+
+
+class TokenBucket:
+    """Non-blocking token bucket shared by every thread in the process.
+
+    When ``state_path`` is given (and the platform has ``fcntl``) the bucket
+    state lives in that file under an exclusive lock, so every gunicorn worker
+    on the host draws from the same budget.
+    """
+
+    def __init__(self, rate, capacity=None, state_path=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.state_path = state_path if fcntl else None
+        self._lock = threading.Lock()
+        self._state = {'tokens': self.capacity, 'ts': time.time(), 'blocked_until': 0.0}
+        if self.state_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+
+    def _take(self, state, now):
+        if now < state['blocked_until']:
+            return False
+        state['tokens'] = min(self.capacity, state['tokens'] + (now - state['ts']) * self.rate)
+        state['ts'] = now
+        if state['tokens'] < 1:
+            return False
+        state['tokens'] -= 1
+        return True
+
+    def _block(self, state, now, seconds):
+        state['blocked_until'] = max(state['blocked_until'], now + seconds)
+        state['tokens'] = 0.0
+        state['ts'] = now
+
+    def _update(self, fn, *args):
+        with self._lock:
+            now = time.time()
+            if not self.state_path:
+                return fn(self._state, now, *args)
+
+            with open(self.state_path, 'a+') as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    fh.seek(0)
+                    try:
+                        state = json.loads(fh.read())
+                    except ValueError:
+                        state = dict(self._state)
+                    result = fn(state, now, *args)
+                    fh.seek(0)
+                    fh.truncate()
+                    fh.write(json.dumps(state))
+                    fh.flush()
+                    return result
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def try_acquire(self):
+        """Take one token if available; never waits"""
+        return self._update(self._take)
+
+    def block_for(self, seconds):
+        """Empty the bucket and refuse tokens for ``seconds`` (e.g. after a 429)"""
+        self._update(self._block, seconds)
+
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures.
+
+    Opens after ``failure_threshold`` consecutive failures; once
+    ``reset_timeout`` seconds have passed a single trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.time())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return self.CLOSED
+        if now - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """Whether a call may go out now"""
+        with self._lock:
+            state = self._state(time.time())
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a permit from allow() that wasn't used for a call"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+            self._trial_in_flight = False
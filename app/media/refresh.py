@@ -0,0 +1,57 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ..extensions import db
+
+
+class MediaRefresher:
+    """Refresh stale Media rows off the request path.
+
+    Requests serve whatever is in the row and hand the refresh to a small
+    thread pool; a media id that is already queued or running is not queued
+    again.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _get_executor(self, app):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=app.config.get('MEDIA_REFRESH_WORKERS', 2),
+                thread_name_prefix='media-refresh',
+            )
+        return self._executor
+
+    def submit(self, app, media_id):
+        """Queue a refresh; returns False if one is already pending"""
+        with self._lock:
+            if media_id in self._pending:
+                return False
+            self._pending.add(media_id)
+            executor = self._get_executor(app)
+        executor.submit(self._run, app, media_id)
+        return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self, app, media_id):
+        from .services import refresh_media
+        try:
+            with app.app_context():
+                try:
+                    refresh_media(media_id)
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Background refresh of media {media_id} failed: {e}")
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._pending.discard(media_id)
+
+
+media_refresher = MediaRefresher()
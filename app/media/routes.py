@@ -1,10 +1,32 @@
-from flask import render_template, request, jsonify, redirect, url_for, current_app
+from flask import render_template, request, jsonify, redirect, url_for, current_app, abort, send_file, session
 from flask_login import login_required
 from . import bp
 from .tmdb import tmdb_client
-from ..models import Media, Viewing, User
+from .services import get_or_create_media, is_stale
+from .refresh import media_refresher
+from .search import incremental_search
+from .images import image_proxy, image_url, ImageUnavailable, NATIVE_SIZES
+from ..models import Media, MediaDiarySummary, Viewing, User
+from ..conditional import conditional
+from ..database import read_replica
+from sqlalchemy import func
 from ..extensions import db
-from datetime import datetime
+from ..diary.summary import refresh_summaries
+from ..diary.fulltext import reindex_media
+from ..diary.versioning import diary_version
+import re
+import uuid
+
+_TAB_ID = re.compile(r'[A-Za-z0-9-]{1,64}')
+
+def _search_session_key():
+    """Key for dropping superseded searches: this browser session plus the
+    page's tab id, so each open tab keeps its own sequence"""
+    sid = session.get('search_sid')
+    if sid is None:
+        sid = session['search_sid'] = uuid.uuid4().hex
+    tab = request.args.get('tab', '')
+    return f'{sid}:{tab}' if _TAB_ID.fullmatch(tab) else sid
 
 @bp.route('/search')
 @login_required
@@ -13,22 +35,44 @@ def search():
     query = request.args.get('q', '').strip()
     media_type = request.args.get('type', 'multi')
     page = int(request.args.get('page', 1))
+    seq = request.args.get('seq', type=int)
+    session_key = _search_session_key()
+    
+    # Too short to be worth a TMDb call - render nothing
+    if len(query) < current_app.config.get('SEARCH_MIN_QUERY_LENGTH', 2):
+        return render_template('components/_search_results.html', results=[], query='')
     
-    if not query:
-        return render_template('components/_search_results.html', results=[], query=query)
+    # A newer keystroke from this tab already arrived; HTMX ignores a 204
+    if not incremental_search.begin(session_key, seq):
+        return '', 204
     
     try:
-        if media_type == 'movie':
-            response = tmdb_client.search_movies(query, page)
-        elif media_type == 'tv':
-            response = tmdb_client.search_tv(query, page)
-        else:
-            response = tmdb_client.search_multi(query, page)
+        response = None
+        if page == 1:
+            response = incremental_search.from_prefix(
+                media_type, query, current_app.config.get('SEARCH_MIN_QUERY_LENGTH', 2)
+            )
+        
+        if response is None:
+            if media_type == 'movie':
+                response = tmdb_client.search_movies(query, page)
+            elif media_type == 'tv':
+                response = tmdb_client.search_tv(query, page)
+            else:
+                # Movies and TV fetched in parallel and merged into one ranked list
+                response = tmdb_client.search_combined(
+                    query, page, pages=current_app.config.get('TMDB_SEARCH_PAGES', 1)
+                )
+            if response and 'results' in response and page == 1:
+                incremental_search.remember(media_type, query, response)
+        
+        if not incremental_search.is_current(session_key, seq):
+            return '', 204
         
         if response and 'results' in response:
             # Add image URLs to results
             for result in response['results']:
-                result['poster_url'] = tmdb_client.build_image_url(result.get('poster_path'), 'w342')
+                result['poster_url'] = image_url(result.get('poster_path'), 'w342')
                 # Handle different date fields
                 if 'release_date' in result:
                     result['year'] = result['release_date'][:4] if result['release_date'] else None
@@ -53,59 +97,39 @@ def search():
                          query=query, 
                          error="Search failed. Please try again.")
 
+def _title_validator(media_type, tmdb_id):
+    """Version markers for a title page, or None when it must render (new or stale media)"""
+    row = db.session.query(Media.updated_at, Media.details_fetched_at, MediaDiarySummary.updated_at,
+                           db.session.query(func.count(User.id)).scalar_subquery())\
+                    .outerjoin(MediaDiarySummary, MediaDiarySummary.media_id == Media.id)\
+                    .filter(Media.tmdb_id == tmdb_id, Media.media_type == media_type)\
+                    .first()
+    if row is None:
+        return None
+    # A stale row has to render so the page can queue its background refresh
+    if is_stale(row, current_app.config.get('MEDIA_STALE_AFTER_DAYS', 7)):
+        return None
+    return list(row) + [tmdb_client.image_base_url]
+
 @bp.route('/title/<media_type>/<int:tmdb_id>')
 @login_required
+@read_replica
+@conditional(_title_validator)
 def title_detail(media_type, tmdb_id):
     """Show title detail page"""
+    if media_type not in ('movie', 'tv'):
+        return "Invalid media type", 400
+    
     # Get or create media record
     media = Media.query.filter_by(tmdb_id=tmdb_id, media_type=media_type).first()
     
     if not media:
-        # Fetch from TMDb and create record
-        if media_type == 'movie':
-            details = tmdb_client.get_movie_details(tmdb_id)
-        elif media_type == 'tv':
-            details = tmdb_client.get_tv_details(tmdb_id)
-        else:
-            return "Invalid media type", 400
-        
-        if not details:
+        media = get_or_create_media(media_type, tmdb_id)
+        if not media:
             return "Media not found", 404
-        
-        # Create media record
-        media = Media(
-            tmdb_id=tmdb_id,
-            media_type=media_type,
-            title=details.get('title') or details.get('name'),
-            release_year=None,
-            poster_path=details.get('poster_path'),
-            backdrop_path=details.get('backdrop_path'),
-            cached_json=details
-        )
-        
-        # Extract year
-        if 'release_date' in details and details['release_date']:
-            media.release_year = int(details['release_date'][:4])
-        elif 'first_air_date' in details and details['first_air_date']:
-            media.release_year = int(details['first_air_date'][:4])
-        
-        db.session.add(media)
-        db.session.commit()
-    else:
-        # Check if cached data is stale (older than 7 days)
-        if (not media.cached_json or 
-            (media.updated_at and 
-             (datetime.utcnow() - media.updated_at).days > 7)):
-            
-            if media_type == 'movie':
-                details = tmdb_client.get_movie_details(tmdb_id)
-            else:
-                details = tmdb_client.get_tv_details(tmdb_id)
-            
-            if details:
-                media.cached_json = details
-                media.updated_at = datetime.utcnow()
-                db.session.commit()
+    elif is_stale(media, current_app.config.get('MEDIA_STALE_AFTER_DAYS', 7)):
+        # Serve the stale row now and refresh it off the request path
+        media_refresher.submit(current_app._get_current_object(), media.id)
     
     # Get viewings from both users (including shared viewings)
     alex = User.query.filter_by(username='alex').first()
@@ -129,8 +153,8 @@ def title_detail(media_type, tmdb_id):
     # No fallback - only show actual individual user viewings
     
     # Build image URLs
-    poster_url = tmdb_client.build_image_url(media.poster_path, 'w500')
-    backdrop_url = tmdb_client.build_image_url(media.backdrop_path, 'w1280')
+    poster_url = image_url(media.poster_path, 'w500')
+    backdrop_url = image_url(media.backdrop_path, 'w1280')
     
     return render_template('media/detail.html', 
                          media=media,
@@ -152,10 +176,37 @@ def delete_media(media_type, tmdb_id):
     try:
         # Delete the media record - cascading deletes will handle viewings and tags
         db.session.delete(media)
+        db.session.flush()
+        refresh_summaries([media.id])
+        reindex_media([media.id])
         db.session.commit()
+        diary_version.bump()
+        from ..diary.fragments import card_cache
+        card_cache.invalidate([media.id])
         
         return jsonify({'success': True}), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to delete media'}), 500
+
+@bp.route('/img/<size>/<filename>')
+def image(size, filename):
+    """Serve a TMDb poster/backdrop from the local image cache"""
+    if not image_proxy.allowed(size, filename):
+        abort(404)
+    
+    webp = image_proxy.wants_webp(request.headers.get('Accept'), filename)
+    try:
+        path, digest, mimetype = image_proxy.get(size, filename, webp)
+    except ImageUnavailable as e:
+        current_app.logger.warning(f"Image proxy fetch failed for {size}/{filename}: {e}")
+        # Let the browser try TMDb directly rather than show a broken image
+        return redirect(image_proxy.upstream_url(size if size in NATIVE_SIZES else 'original', filename))
+    
+    # Variants never change once stored, so browsers can keep them forever
+    response = send_file(path, mimetype=mimetype, etag=digest, conditional=True, max_age=365 * 24 * 60 * 60)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    if current_app.config.get('IMAGE_PROXY_WEBP'):
+        response.vary.add('Accept')
+    return response
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from ..cache import MemoryCache
+
+
+def _title_matches(result, terms):
+    title = ' '.join(
+        (result.get(field) or '') for field in ('title', 'name', 'original_title', 'original_name')
+    ).lower()
+    return all(term in title for term in terms)
+
+
+class IncrementalSearch:
+    """Server-side state for type-ahead search.
+
+    Tracks the latest request sequence number per tab so superseded
+    requests can be dropped, and keeps recent first-page results so a query
+    that extends a cached prefix can be answered locally.
+    """
+
+    def __init__(self, max_sessions=512, max_results=512, ttl=5 * 60):
+        self.ttl = ttl
+        self._results = MemoryCache(max_results)
+        self._seqs = OrderedDict()
+        self._max_sessions = max_sessions
+        self._lock = threading.Lock()
+
+    def begin(self, session_key, seq):
+        """Record a request's sequence number; False if a newer one was already seen"""
+        if seq is None:
+            return True
+        with self._lock:
+            latest = self._seqs.get(session_key)
+            if latest is not None and seq < latest:
+                return False
+            self._seqs[session_key] = seq
+            self._seqs.move_to_end(session_key)
+            while len(self._seqs) > self._max_sessions:
+                self._seqs.popitem(last=False)
+        return True
+
+    def is_current(self, session_key, seq):
+        """Whether no newer request has arrived from the same tab since ``seq``"""
+        if seq is None:
+            return True
+        with self._lock:
+            return self._seqs.get(session_key, seq) <= seq
+
+    def remember(self, media_type, query, response):
+        """Keep a first-page response for prefix reuse"""
+        self._results.set(self._key(media_type, query), response, self.ttl)
+
+    def from_prefix(self, media_type, query, min_length):
+        """Answer ``query`` from a cached shorter prefix when that is safe.
+
+        Only reused when the prefix response was complete (every match fits on
+        its first page), because then any title matching the longer query was
+        already in it and filtering locally can't miss anything TMDb would
+        rank for the prefix. Returns None when TMDb has to be asked.
+        """
+        normalized = query.strip().lower()
+        terms = normalized.split()
+        for end in range(len(normalized) - 1, min_length - 1, -1):
+            prefix = self._results.get(self._key(media_type, normalized[:end]))
+            if prefix is None:
+                continue
+            if prefix.get('total_pages', 1) > 1 or prefix.get('total_results', 0) > len(prefix['results']):
+                return None
+            results = [r for r in prefix['results'] if _title_matches(r, terms)]
+            return {'page': 1, 'results': results, 'total_pages': 1, 'total_results': len(results)}
+        return None
+
+    @staticmethod
+    def _key(media_type, query):
+        return f"{media_type}:{query.strip().lower()}"
+
+
+incremental_search = IncrementalSearch()
@@ -0,0 +1,163 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from .tmdb import tmdb_client
+from ..models import Media, MediaCast
+from ..extensions import db
+
+
+def fetch_details(media_type, tmdb_id):
+    """Fetch TMDb details for a movie or TV show (None if unavailable)"""
+    if media_type == 'movie':
+        return tmdb_client.get_movie_details(tmdb_id)
+    return tmdb_client.get_tv_details(tmdb_id)
+
+
+def media_values(details):
+    """Column values for a Media row projected out of a TMDb details payload.
+
+    Only the fields the app renders are kept; the raw payload is stored
+    compressed when MEDIA_STORE_RAW_DETAILS is on and dropped otherwise.
+    """
+    runtime = details.get('runtime')
+    if runtime is None and details.get('episode_run_time'):
+        runtime = details['episode_run_time'][0]
+
+    values = {
+        'title': details.get('title') or details.get('name'),
+        'release_year': None,
+        'poster_path': details.get('poster_path'),
+        'backdrop_path': details.get('backdrop_path'),
+        'overview': details.get('overview') or None,
+        'runtime': runtime,
+        'genres': [genre['name'] for genre in details.get('genres') or []],
+        'details_fetched_at': datetime.utcnow(),
+        'cached_json': None,
+        'raw_details': None,
+    }
+
+    # Extract year
+    if 'release_date' in details and details['release_date']:
+        values['release_year'] = int(details['release_date'][:4])
+    elif 'first_air_date' in details and details['first_air_date']:
+        values['release_year'] = int(details['first_air_date'][:4])
+
+    if current_app.config.get('MEDIA_STORE_RAW_DETAILS'):
+        values['raw_details'] = zlib.compress(json.dumps(details).encode('utf-8'))
+
+    return values
+
+
+def cast_values(details):
+    """Top-billed cast rows (MEDIA_CAST_LIMIT of them) from a TMDb payload"""
+    cast = (details.get('credits') or {}).get('cast') or []
+    cast = sorted(cast, key=lambda member: member.get('order', 0))
+    return [
+        {
+            'position': position,
+            'name': member.get('name') or '',
+            'character': member.get('character'),
+            'profile_path': member.get('profile_path'),
+        }
+        for position, member in enumerate(cast[:current_app.config.get('MEDIA_CAST_LIMIT', 12)])
+    ]
+
+
+def apply_details(media, details):
+    """Overwrite a Media row's projected fields and cast from a TMDb payload"""
+    for column, value in media_values(details).items():
+        setattr(media, column, value)
+    media.cast = [MediaCast(**values) for values in cast_values(details)]
+
+
+def insert_media_ignoring_conflicts(rows):
+    """Multi-row INSERT ... ON CONFLICT DO NOTHING on the (tmdb_id, media_type) key.
+
+    Returns the number of rows this call inserted.
+    """
+    if not rows:
+        return 0
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(Media).values(rows)
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(Media).values(rows)
+    else:
+        stmt = None
+
+    if stmt is not None:
+        result = db.session.execute(stmt.on_conflict_do_nothing(index_elements=['tmdb_id', 'media_type']))
+        return result.rowcount
+
+    # Backends without ON CONFLICT: let the unique constraint arbitrate
+    inserted = 0
+    for values in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Media).values(**values))
+            inserted += 1
+        except IntegrityError:
+            pass
+    return inserted
+
+
+def _insert_ignoring_conflicts(values):
+    """Insert one Media row unless it exists; returns True if this call inserted it"""
+    return insert_media_ignoring_conflicts([values]) == 1
+
+
+def get_or_create_media(media_type, tmdb_id):
+    """Return the Media row for a TMDb title, creating it on first use.
+
+    Concurrent callers for the same title share one TMDb fetch (the client
+    coalesces in-flight requests) and the row is written with an upsert, so
+    losing the race to another worker is not an error. Returns None when
+    TMDb has no such title.
+    """
+    media = Media.query.filter_by(tmdb_id=tmdb_id, media_type=media_type).first()
+    if media:
+        return media
+
+    details = fetch_details(media_type, tmdb_id)
+    if not details:
+        return None
+
+    inserted = _insert_ignoring_conflicts(dict(media_values(details), tmdb_id=tmdb_id, media_type=media_type))
+    media = Media.query.filter_by(tmdb_id=tmdb_id, media_type=media_type).one()
+    cast = cast_values(details)
+    if inserted and cast:
+        db.session.execute(insert(MediaCast), [dict(values, media_id=media.id) for values in cast])
+    db.session.commit()
+
+    return media
+
+
+def is_stale(media, max_age_days):
+    """Whether a Media row's TMDb details are due for a refresh"""
+    if media.details_fetched_at is None:
+        return True
+    return datetime.utcnow() - media.details_fetched_at > timedelta(days=max_age_days)
+
+
+def refresh_media(media_id):
+    """Re-fetch TMDb details for a Media row; returns True if it was updated"""
+    media = db.session.get(Media, media_id)
+    if not media:
+        return False
+
+    details = fetch_details(media.media_type, media.tmdb_id)
+    if not details:
+        return False
+
+    from ..diary.fulltext import reindex_media
+    apply_details(media, details)
+    db.session.flush()
+    # Title and cast are part of the diary search documents
+    reindex_media([media.id])
+    db.session.commit()
+    return True
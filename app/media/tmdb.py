@@ -1,15 +1,77 @@
 import requests
 from flask import current_app
-from datetime import datetime, timedelta
-import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
 import json
+from ..cache import MemoryCache, SQLiteCache, TieredCache
+from .singleflight import SingleFlight
+from .ratelimit import TokenBucket, CircuitBreaker
+from .. import instrumentation
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import contextvars
+import math
+import threading
+import time
+from functools import lru_cache
+
+DEFAULT_IMAGE_BASE_URL = 'https://image.tmdb.org/t/p/'
+
+class TMDbUnavailable(Exception):
+    """TMDb can't be called right now and there is no cached copy to serve"""
+
+def _search_rank(query, result):
+    """Sort key: exact title match, then prefix, then substring, then popularity"""
+    query = query.strip().lower()
+    title = (result.get('title') or result.get('name') or '').lower()
+    if title == query:
+        match = 0
+    elif title.startswith(query):
+        match = 1
+    elif query in title:
+        match = 2
+    else:
+        match = 3
+    return (match, -(result.get('popularity') or 0))
+
+def _retry_after(value, default=1):
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date)"""
+    if not value:
+        return default
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0, math.ceil((when - datetime.now(timezone.utc)).total_seconds()))
+
+@lru_cache(maxsize=8192)
+def _image_url(base_url, size, path):
+    return f"{base_url}{size}{path}"
 
 class TMDbClient:
     def __init__(self):
         self.base_url = None
         self.api_key = None
-        self.image_base_url = None
+        self.image_base_url = DEFAULT_IMAGE_BASE_URL
         self.config_cached_at = None
+        self._image_config_thread = None
+        self._image_config_lock = threading.Lock()
+        self.cache = None
+        self.cache_ttls = {}
+        self.inflight = SingleFlight()
+        self.rate_limiter = None
+        self.breaker = None
+        self.metrics = Counter()
+        self._metrics_lock = threading.Lock()
+        self.search_executor = None
         self.session = requests.Session()
         self.session.timeout = 10
     
@@ -19,73 +81,224 @@ class TMDbClient:
             self.base_url = current_app.config['TMDB_BASE_URL']
             self.api_key = current_app.config['TMDB_API_KEY']
         
-    def _make_request(self, endpoint, params=None, retries=3):
-        """Make API request with retry logic and rate limiting"""
+        if self.cache is None and current_app:
+            shared_path = current_app.config.get('TMDB_SHARED_CACHE_PATH')
+            self.cache = TieredCache(
+                MemoryCache(current_app.config.get('TMDB_CACHE_SIZE', 1024)),
+                SQLiteCache(shared_path) if shared_path else None,
+            )
+            self.cache_ttls = current_app.config.get('TMDB_CACHE_TTLS', {})
+        
+        if self.search_executor is None and current_app:
+            workers = current_app.config.get('TMDB_SEARCH_WORKERS', 4)
+            self.search_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tmdb-search')
+            # Keep one pooled connection per search thread (plus the request thread)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers + 1)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+        
+        if self.rate_limiter is None and current_app:
+            self.rate_limiter = TokenBucket(
+                current_app.config.get('TMDB_RATE_LIMIT', 35),
+                current_app.config.get('TMDB_RATE_BURST', 20),
+                current_app.config.get('TMDB_RATE_LIMIT_STATE_PATH'),
+            )
+            self.breaker = CircuitBreaker(
+                current_app.config.get('TMDB_BREAKER_THRESHOLD', 5),
+                current_app.config.get('TMDB_BREAKER_RESET_SECONDS', 30),
+            )
+    
+    def _cache_ttl(self, endpoint):
+        """TTL in seconds for an endpoint (longest matching prefix), 0 if uncached"""
+        endpoint = '/' + endpoint.lstrip('/')
+        matches = [prefix for prefix in self.cache_ttls if endpoint.startswith(prefix)]
+        if not matches:
+            return 0
+        return self.cache_ttls[max(matches, key=len)]
+    
+    def cache_stats(self):
+        """Hit/miss counters for each cache tier"""
+        return self.cache.stats() if self.cache else {}
+    
+    def request_stats(self):
+        """Outbound call counters (sent, throttled, short-circuited, ...)"""
+        with self._metrics_lock:
+            stats = dict(self.metrics)
+        stats['circuit'] = self.breaker.state if self.breaker else CircuitBreaker.CLOSED
+        return stats
+    
+    def _count(self, name):
+        with self._metrics_lock:
+            self.metrics[name] += 1
+    
+    def _serve_stale(self, cache_key, reason, error=None):
+        """Fall back to the last cached copy, expired or not"""
+        stale = self.cache.get_stale(cache_key) if self.cache else None
+        if stale is not None:
+            self._count('stale_served')
+            return stale
+        if error is not None:
+            raise error
+        raise TMDbUnavailable(reason)
+        
+    def _make_request(self, endpoint, params=None):
+        """Make API request with caching, rate limiting and a circuit breaker"""
         self._ensure_config()
         
         if params is None:
             params = {}
         
+        ttl = self._cache_ttl(endpoint)
+        cache_key = f"tmdb:/{endpoint.lstrip('/')}?{urlencode(sorted(params.items()))}"
+        if ttl:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                instrumentation.record_tmdb_cache_hit()
+                return cached
+        
+        # Concurrent misses for the same request share one outbound call
+        return self.inflight.do(cache_key, self._fetch, endpoint, params, cache_key, ttl)
+    
+    def _fetch(self, endpoint, params, cache_key, ttl):
+        """Call TMDb once and store a successful response in the cache.
+        
+        Never sleeps and never retries inline: when the rate limiter or
+        circuit breaker refuses the call, TMDb answers 429, or the call
+        fails, the last cached copy is served instead. Retrying a degraded
+        TMDb is left to the breaker's half-open trial.
+        """
         params['api_key'] = self.api_key
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
         
-        for attempt in range(retries):
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            return self._serve_stale(cache_key, 'TMDb circuit is open')
+        
+        if not self.rate_limiter.try_acquire():
+            self.breaker.release()
+            self._count('throttled')
+            return self._serve_stale(cache_key, 'TMDb request budget exhausted')
+        
+        self._count('requests')
+        started = time.perf_counter()
+        status = 'error'
+        settled = False
+        try:
             try:
-                response = self.session.get(url, params=params)
-                
-                if response.status_code == 429:
-                    # Rate limited - wait and retry
-                    retry_after = int(response.headers.get('Retry-After', 1))
-                    time.sleep(retry_after)
-                    continue
-                
-                response.raise_for_status()
-                return response.json()
-                
-            except requests.exceptions.RequestException as e:
-                if attempt == retries - 1:
-                    current_app.logger.error(f"TMDb API request failed: {e}")
-                    raise
-                time.sleep(2 ** attempt)  # Exponential backoff
-        
-        return None
+                response = self.session.get(url, params=params, timeout=self.session.timeout)
+                status = response.status_code
+            finally:
+                instrumentation.record_tmdb_call(time.perf_counter() - started, status)
+            
+            if response.status_code == 429:
+                # Rate limited - stop every worker until Retry-After passes
+                self.rate_limiter.block_for(_retry_after(response.headers.get('Retry-After')))
+                self._count('rate_limited')
+                return self._serve_stale(cache_key, 'Rate limited by TMDb')
+            
+            response.raise_for_status()
+            # A 200 that isn't JSON (a proxy's error page) is a failure too
+            data = response.json()
+            
+        except (requests.exceptions.RequestException, ValueError) as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            settled = True
+            if status is not None and status < 500:
+                # TMDb is up, the request itself was bad (e.g. unknown id)
+                self.breaker.record_success()
+                raise
+            
+            self.breaker.record_failure()
+            self._count('errors')
+            current_app.logger.error(f"TMDb API request failed: {e}")
+            return self._serve_stale(cache_key, str(e), error=e)
+        
+        finally:
+            # Anything else (429, an unexpected error) must not leave a
+            # half-open trial in flight forever
+            if not settled:
+                self.breaker.release()
+        
+        self.breaker.record_success()
+        if ttl:
+            self.cache.set(cache_key, data, ttl)
+        return data
+    
+    def init_app(self, app):
+        """Seed the image base URL from config and refresh it in the background.
+
+        The refresher starts with the first request (not at import, so CLI
+        commands never spawn it). Workers share /configuration through the
+        TMDb response cache, so with TMDB_SHARED_CACHE_PATH set only one of
+        them calls TMDb per day.
+        """
+        self.image_base_url = app.config.get('TMDB_IMAGE_BASE_URL', DEFAULT_IMAGE_BASE_URL).rstrip('/') + '/'
+        if app.config.get('TMDB_IMAGE_CONFIG_REFRESH_SECONDS'):
+            app.before_request(lambda: self.start_image_config_refresher(app))
+    
+    def start_image_config_refresher(self, app):
+        """Start the daemon thread that keeps image_base_url current (once)"""
+        if self._image_config_thread is not None:
+            return
+        with self._image_config_lock:
+            if self._image_config_thread is not None:
+                return
+            self._image_config_thread = threading.Thread(
+                target=self._refresh_image_config_forever, args=(app,),
+                name='tmdb-image-config', daemon=True,
+            )
+        self._image_config_thread.start()
+    
+    def _refresh_image_config_forever(self, app):
+        interval = app.config.get('TMDB_IMAGE_CONFIG_REFRESH_SECONDS', 24 * 60 * 60)
+        retry = app.config.get('TMDB_IMAGE_CONFIG_RETRY_SECONDS', 5 * 60)
+        while True:
+            with app.app_context():
+                ok = self.refresh_image_config()
+            time.sleep(interval if ok else retry)
+    
+    def refresh_image_config(self):
+        """Fetch /configuration and adopt its image base URL; False on failure.
+
+        A failure keeps the current base URL and is retried later instead of
+        pinning the fallback.
+        """
+        try:
+            config = self._make_request('/configuration')
+            if config:
+                self.image_base_url = config['images']['secure_base_url']
+                self.config_cached_at = datetime.utcnow()
+                return True
+        except Exception as e:
+            current_app.logger.error(f"Failed to fetch TMDb configuration: {e}")
+        return False
     
     def get_configuration(self):
-        """Get TMDb configuration, cached for 24 hours"""
-        if (self.image_base_url is None or 
-            self.config_cached_at is None or 
+        """Image base URL, refreshed inline if older than 24 hours (may block on TMDb)"""
+        if (self.config_cached_at is None or 
             datetime.utcnow() - self.config_cached_at > timedelta(hours=24)):
-            
-            try:
-                config = self._make_request('/configuration')
-                if config:
-                    self.image_base_url = config['images']['secure_base_url']
-                    self.config_cached_at = datetime.utcnow()
-            except Exception as e:
-                current_app.logger.error(f"Failed to fetch TMDb configuration: {e}")
-                # Fallback to default
-                self.image_base_url = 'https://image.tmdb.org/t/p/'
+            self.refresh_image_config()
         
         return self.image_base_url
     
-    def search_movies(self, query, page=1):
-        """Search for movies"""
+    def search_movies(self, query, page=1, year=None):
+        """Search for movies, optionally only those released in ``year``"""
         try:
-            return self._make_request('/search/movie', {
-                'query': query,
-                'page': page
-            })
+            params = {'query': query, 'page': page}
+            if year:
+                params['primary_release_year'] = year
+            return self._make_request('/search/movie', params)
         except Exception as e:
             current_app.logger.error(f"Movie search failed: {e}")
             return None
     
-    def search_tv(self, query, page=1):
-        """Search for TV shows"""
+    def search_tv(self, query, page=1, year=None):
+        """Search for TV shows, optionally only those first aired in ``year``"""
         try:
-            return self._make_request('/search/tv', {
-                'query': query,
-                'page': page
-            })
+            params = {'query': query, 'page': page}
+            if year:
+                params['first_air_date_year'] = year
+            return self._make_request('/search/tv', params)
         except Exception as e:
             current_app.logger.error(f"TV search failed: {e}")
             return None
@@ -101,6 +314,72 @@ class TMDbClient:
             current_app.logger.error(f"Multi search failed: {e}")
             return None
     
+    def search_combined(self, query, page=1, media_types=('movie', 'tv'), pages=1):
+        """Search several media types (and pages) in parallel and merge the results.
+        
+        Fetches TMDb pages ``(page - 1) * pages + 1 .. page * pages`` for each
+        media type concurrently, tags each result with its media type, drops
+        duplicates and ranks title matches first, then by popularity. Returns a
+        TMDb-shaped payload whose ``page``/``total_pages`` count in steps of
+        ``pages`` TMDb pages, or None if every sub-request failed.
+        """
+        self._ensure_config()
+        app = current_app._get_current_object()
+        first_page = (page - 1) * pages + 1
+        
+        def fetch(media_type, tmdb_page):
+            with app.app_context():
+                return media_type, self._make_request(f'/search/{media_type}', {
+                    'query': query,
+                    'page': tmdb_page
+                })
+        
+        # Each call runs in a copy of this context so it counts toward the request
+        futures = [
+            self.search_executor.submit(contextvars.copy_context().run, fetch, media_type, tmdb_page)
+            for media_type in media_types
+            for tmdb_page in range(first_page, first_page + pages)
+        ]
+        
+        responses = []
+        for future in futures:
+            try:
+                responses.append(future.result())
+            except Exception as e:
+                current_app.logger.error(f"Combined search request failed: {e}")
+        
+        if not responses:
+            return None
+        
+        seen = set()
+        results = []
+        for media_type, response in responses:
+            for result in (response or {}).get('results', []):
+                key = (media_type, result.get('id'))
+                if key in seen:
+                    continue
+                seen.add(key)
+                result['media_type'] = media_type
+                results.append(result)
+        
+        results.sort(key=lambda result: _search_rank(query, result))
+        
+        total_pages = max((response or {}).get('total_pages', 1) for _, response in responses)
+        return {
+            'page': page,
+            'results': results,
+            'total_pages': max(1, math.ceil(total_pages / pages)),
+            'total_results': sum((response or {}).get('total_results', 0) for _, response in responses),
+        }
+    
+    def find_by_imdb_id(self, imdb_id):
+        """Look up TMDb titles by IMDb id (``movie_results``/``tv_results``)"""
+        try:
+            return self._make_request(f'/find/{imdb_id}', {'external_source': 'imdb_id'})
+        except Exception as e:
+            current_app.logger.error(f"IMDb lookup failed: {e}")
+            return None
+    
     def get_movie_details(self, movie_id, append_to_response='credits'):
         """Get movie details"""
         try:
@@ -124,12 +403,11 @@ class TMDbClient:
             return None
     
     def build_image_url(self, path, size='w500'):
-        """Build full image URL"""
+        """Build full image URL (string work only; safe to call while rendering)"""
         if not path:
             return None
         
-        base_url = self.get_configuration()
-        return f"{base_url}{size}{path}"
+        return _image_url(self.image_base_url, size, path)
 
 # Global client instance
 tmdb_client = TMDbClient()
\ No newline at end of file
@@ -0,0 +1,304 @@
+import hmac
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+from flask import Response, current_app, g, request
+from .extensions import db
+
+# Seconds; shared by every latency histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by route'),
+    'db_pool_checkout_seconds': ('histogram', 'Time spent waiting for a pooled DB connection'),
+    'db_pool_size': ('gauge', 'Configured pool size'),
+    'db_pool_checked_out': ('gauge', 'Connections currently in use'),
+    'db_pool_checked_in': ('gauge', 'Idle connections held by the pool'),
+    'db_pool_overflow': ('gauge', 'Connections open beyond pool_size (negative while the pool fills)'),
+    'tmdb_request_duration_seconds': ('histogram', 'TMDb call latency by HTTP status'),
+    'tmdb_calls_total': ('counter', 'TMDb client outcomes (requests, errors, throttled, ...)'),
+    'tmdb_circuit_open': ('gauge', '1 while the TMDb circuit breaker is failing fast'),
+    'tmdb_cache_hits_total': ('counter', 'TMDb response cache hits by tier'),
+    'tmdb_cache_misses_total': ('counter', 'TMDb response cache misses by tier'),
+    'tmdb_cache_hit_ratio': ('gauge', 'TMDb response cache hit ratio by tier, across workers'),
+}
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+class Registry:
+    """Counters and histograms observed in this process.
+
+    Gauges and counters kept elsewhere (pool state, the TMDb client's own
+    counters) are read by collectors when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            counts = self.histograms.get(key)
+            if counts is None:
+                # One slot per bucket, then +Inf, then the sum
+                counts = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(BUCKETS)] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                'counters': dict(self.counters),
+                'gauges': {},
+                'histograms': {key: list(counts) for key, counts in self.histograms.items()},
+            }
+        for collect in self.collectors:
+            for kind, name, labels, value in collect():
+                snapshot[kind][_key(name, labels)] = value
+        return snapshot
+
+
+class MetricsStore:
+    """One snapshot file per worker process, merged when /metrics is scraped.
+
+    Any worker can answer the scrape. Counters and histograms of workers
+    that have exited are kept so totals never go backwards; their gauges
+    are dropped. Clear the directory when the server starts.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, snapshot):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(snapshot, fh)
+        os.replace(tmp, os.path.join(self.directory, f'{os.getpid()}.json'))
+
+    def read_all(self):
+        snapshots = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path) as fh:
+                    snapshot = json.load(fh)
+            except (FileNotFoundError, ValueError):
+                continue
+            if not _alive(int(entry.name[:-5])):
+                snapshot['gauges'] = {}
+            snapshots.append(snapshot)
+        return snapshots
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge(snapshots):
+    merged = {'counters': {}, 'gauges': {}, 'histograms': {}}
+    for snapshot in snapshots:
+        for kind in ('counters', 'gauges'):
+            for key, value in snapshot[kind].items():
+                merged[kind][key] = merged[kind].get(key, 0) + value
+        for key, counts in snapshot['histograms'].items():
+            total = merged['histograms'].setdefault(key, [0] * len(counts))
+            for i, value in enumerate(counts):
+                total[i] += value
+    return merged
+
+
+def _labels(pairs, extra=None):
+    pairs = list(pairs) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = ('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def render(merged):
+    """Prometheus text exposition format (0.0.4)"""
+    series = {}
+    for kind in ('counters', 'gauges', 'histograms'):
+        for key, value in merged[kind].items():
+            name, pairs = json.loads(key)
+            series.setdefault(name, []).append((pairs, value))
+
+    lines = []
+    for name in sorted(series):
+        kind, help_text = HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for pairs, value in sorted(series[name], key=lambda item: item[0]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(pairs)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(BUCKETS) + ['+Inf'], value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(pairs, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(pairs)} {value[-1]}')
+            lines.append(f'{name}_count{_labels(pairs)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _hit_ratios(merged):
+    """Derive cache hit ratios from the merged hit/miss counters"""
+    totals = {}
+    for key, value in merged['counters'].items():
+        name, pairs = json.loads(key)
+        if name in ('tmdb_cache_hits_total', 'tmdb_cache_misses_total'):
+            tier = dict(pairs)['tier']
+            totals.setdefault(tier, [0, 0])[name == 'tmdb_cache_misses_total'] += value
+    for tier, (hits, misses) in totals.items():
+        ratio = hits / (hits + misses) if hits + misses else 0.0
+        merged['gauges'][_key('tmdb_cache_hit_ratio', {'tier': tier})] = ratio
+
+
+def _pool_gauges():
+    for name, engine in db.engines.items():
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            continue
+        labels = {'engine': name or 'default'}
+        yield 'gauges', 'db_pool_size', labels, pool.size()
+        yield 'gauges', 'db_pool_checked_out', labels, pool.checkedout()
+        yield 'gauges', 'db_pool_checked_in', labels, pool.checkedin()
+        yield 'gauges', 'db_pool_overflow', labels, pool.overflow()
+
+
+def _tmdb_counters():
+    from .media.tmdb import tmdb_client
+    from .media.ratelimit import CircuitBreaker
+    stats = tmdb_client.request_stats()
+    yield 'gauges', 'tmdb_circuit_open', {}, int(stats.pop('circuit') == CircuitBreaker.OPEN)
+    for outcome, value in stats.items():
+        yield 'counters', 'tmdb_calls_total', {'outcome': outcome}, value
+    for tier, tier_stats in tmdb_client.cache_stats().items():
+        yield 'counters', 'tmdb_cache_hits_total', {'tier': tier}, tier_stats['hits']
+        yield 'counters', 'tmdb_cache_misses_total', {'tier': tier}, tier_stats['misses']
+
+
+registry = Registry()
+registry.collectors.extend([_pool_gauges, _tmdb_counters])
+
+_store = None
+_flushed_at = 0.0
+
+
+def _timed_checkouts(name, pool):
+    """Wrap a pool's connect() to observe how long each checkout waits"""
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            registry.observe('db_pool_checkout_seconds', time.perf_counter() - started, engine=name or 'default')
+
+    pool.connect = timed_connect
+
+
+def _flush(force=False):
+    global _flushed_at
+    if _store is None:
+        return
+    now = time.monotonic()
+    if force or now - _flushed_at >= current_app.config.get('METRICS_FLUSH_SECONDS', 5):
+        _flushed_at = now
+        _store.write(registry.snapshot())
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _observe_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        registry.observe('http_request_duration_seconds', time.perf_counter() - started,
+                         endpoint=request.endpoint or 'none', method=request.method,
+                         status=str(response.status_code))
+    _flush()
+    return response
+
+
+def _from_private_network():
+    """Whether the request came straight from a private or loopback address
+    (anything relayed by a proxy counts as public)"""
+    if request.headers.get('X-Forwarded-For') or request.headers.get('Forwarded'):
+        return False
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return address.is_private or address.is_loopback
+
+
+def metrics_view():
+    """Every worker's metrics in Prometheus text format.
+
+    With METRICS_TOKEN set the scraper must send it as a bearer token;
+    without one only direct requests from a private network are answered
+    and everyone else gets a 404.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response('Unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'})
+    elif not _from_private_network():
+        return Response('Not Found\n', 404)
+
+    if _store is not None:
+        _flush(force=True)
+        merged = merge(_store.read_all())
+    else:
+        merged = merge([registry.snapshot()])
+    _hit_ratios(merged)
+    return Response(render(merged), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Serve /metrics and record request, pool and TMDb metrics.
+
+    With METRICS_DIR set, each worker writes its snapshot there (at most
+    every METRICS_FLUSH_SECONDS) so a scrape of any worker sees them all.
+    """
+    global _store
+    if app.config.get('METRICS_DIR'):
+        _store = MetricsStore(app.config['METRICS_DIR'])
+
+    with app.app_context():
+        for name, engine in db.engines.items():
+            _timed_checkouts(name, engine.pool)
+
+    app.before_request(_start_timer)
+    app.after_request(_observe_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
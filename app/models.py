@@ -1,7 +1,10 @@
+import json
+import zlib
 from datetime import datetime, date
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import CheckConstraint, Index, func
+from sqlalchemy import CheckConstraint, DDL, Index, event, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from passlib.hash import argon2
 from .extensions import db
 
@@ -34,20 +37,53 @@ class Media(db.Model):
     release_year = db.Column(db.Integer, nullable=True)
     poster_path = db.Column(db.Text, nullable=True)
     backdrop_path = db.Column(db.Text, nullable=True)
-    cached_json = db.Column(db.JSON, nullable=True)
+    # Legacy full TMDb payload; superseded by the projected columns below
+    cached_json = db.Column(db.JSON(none_as_null=True), nullable=True)
+    # Fields the templates actually use, projected out of the TMDb payload
+    overview = db.Column(db.Text, nullable=True)
+    runtime = db.Column(db.Integer, nullable=True)
+    genres = db.Column(db.JSON, nullable=True)
+    details_fetched_at = db.Column(db.DateTime, nullable=True)
+    # Optional zlib-compressed raw payload, only loaded when asked for
+    raw_details = db.deferred(db.Column(db.LargeBinary, nullable=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     viewings = db.relationship('Viewing', backref='media', lazy='dynamic', cascade='all, delete-orphan')
+    cast = db.relationship('MediaCast', order_by='MediaCast.position', lazy='select',
+                           cascade='all, delete-orphan', passive_deletes=True)
     
     __table_args__ = (
         Index('ix_media_type_title', 'media_type', 'title'),
         db.UniqueConstraint('tmdb_id', 'media_type', name='uq_tmdb_id_media_type'),
     )
     
+    def raw_payload(self):
+        """Decompressed TMDb payload, if one was stored"""
+        if self.raw_details:
+            return json.loads(zlib.decompress(self.raw_details))
+        return self.cached_json
+    
     def __repr__(self):
         return f'<Media {self.title} ({self.media_type})>'
 
+class MediaCast(db.Model):
+    __tablename__ = 'media_cast'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id', ondelete='CASCADE'), nullable=False)
+    position = db.Column(db.SmallInteger, nullable=False)
+    name = db.Column(db.Text, nullable=False)
+    character = db.Column(db.Text, nullable=True)
+    profile_path = db.Column(db.Text, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_media_cast_media_position', 'media_id', 'position'),
+    )
+    
+    def __repr__(self):
+        return f'<MediaCast {self.name} as {self.character}>'
+
 class Viewing(db.Model):
     __tablename__ = 'viewings'
     
@@ -66,11 +102,81 @@ class Viewing(db.Model):
     __table_args__ = (
         CheckConstraint('rating >= 1 AND rating <= 5', name='check_rating_range'),
         Index('ix_user_watched_on', 'user_id', 'watched_on'),
+        # The diary's year/tag filters probe viewings per media row
+        Index('ix_viewings_media_id', 'media_id'),
     )
     
     def __repr__(self):
         return f'<Viewing {self.media.title} by {self.user.username}>'
 
+class MediaDiarySummary(db.Model):
+    """Denormalized per-media diary state, kept current on every viewing write"""
+    __tablename__ = 'media_diary_summary'
+    
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id', ondelete='CASCADE'), primary_key=True)
+    last_watched_on = db.Column(db.Date, nullable=False)
+    max_rating = db.Column(db.SmallInteger, nullable=False)
+    viewing_count = db.Column(db.Integer, nullable=False, default=0)
+    latest_viewing_id = db.Column(db.Integer, nullable=False)
+    # {user_id: viewing_id} of each user's latest viewing (JSON keys are strings)
+    user_latest = db.Column(db.JSON, nullable=False, default=dict)
+    # Ids of every tag used on any viewing of the media
+    tag_ids = db.Column(db.JSON, nullable=False, default=list)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_summary_newest', 'last_watched_on', 'media_id'),
+        Index('ix_summary_highest_rated', 'max_rating', 'last_watched_on', 'media_id'),
+    )
+    
+    def __repr__(self):
+        return f'<MediaDiarySummary media={self.media_id} viewings={self.viewing_count}>'
+
+class ViewingSearch(db.Model):
+    """Per-viewing full-text search document, rewritten on every diary write.
+
+    On Postgres ``document`` holds the weighted tsvector behind a GIN index;
+    on SQLite the text columns feed the viewing_search_fts FTS5 table
+    through triggers and ``document`` stays empty.
+    """
+    __tablename__ = 'viewing_search'
+    
+    viewing_id = db.Column(db.Integer, db.ForeignKey('viewings.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id', ondelete='CASCADE'), nullable=False, index=True)
+    title = db.Column(db.Text, nullable=False)
+    comment = db.Column(db.Text, nullable=True)
+    tags = db.Column(db.Text, nullable=True)
+    cast_names = db.Column(db.Text, nullable=True)
+    document = db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql'), nullable=True)
+    
+    def __repr__(self):
+        return f'<ViewingSearch viewing={self.viewing_id}>'
+
+event.listen(ViewingSearch.__table__, 'after_create',
+             DDL('CREATE INDEX ix_viewing_search_document ON viewing_search USING gin (document)')
+             .execute_if(dialect='postgresql'))
+
+_SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE viewing_search_fts USING fts5("
+    "title, comment, tags, cast_names, content='viewing_search', content_rowid='viewing_id', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER viewing_search_ai AFTER INSERT ON viewing_search BEGIN "
+    "INSERT INTO viewing_search_fts (rowid, title, comment, tags, cast_names) "
+    "VALUES (new.viewing_id, new.title, new.comment, new.tags, new.cast_names); END",
+    "CREATE TRIGGER viewing_search_ad AFTER DELETE ON viewing_search BEGIN "
+    "INSERT INTO viewing_search_fts (viewing_search_fts, rowid, title, comment, tags, cast_names) "
+    "VALUES ('delete', old.viewing_id, old.title, old.comment, old.tags, old.cast_names); END",
+    "CREATE TRIGGER viewing_search_au AFTER UPDATE ON viewing_search BEGIN "
+    "INSERT INTO viewing_search_fts (viewing_search_fts, rowid, title, comment, tags, cast_names) "
+    "VALUES ('delete', old.viewing_id, old.title, old.comment, old.tags, old.cast_names); "
+    "INSERT INTO viewing_search_fts (rowid, title, comment, tags, cast_names) "
+    "VALUES (new.viewing_id, new.title, new.comment, new.tags, new.cast_names); END",
+]
+for statement in _SQLITE_FTS_DDL:
+    event.listen(ViewingSearch.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(ViewingSearch.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS viewing_search_fts').execute_if(dialect='sqlite'))
+
 class Tag(db.Model):
     __tablename__ = 'tags'
     
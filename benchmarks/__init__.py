@@ -0,0 +1 @@
+"""Benchmark harness: synthetic data, a fake TMDb and scripted scenarios (see run.py)"""
@@ -0,0 +1,126 @@
+"""Synthetic diary data at realistic proportions.
+
+A few titles are watched over and over while most are watched once
+(Zipf-like popularity), ratings lean towards 3-4 stars, recent years hold
+most viewings, and a handful of tags account for most tagging.
+"""
+import itertools
+import random
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert
+from app.extensions import db
+from app.models import Media, MediaCast, Tag, User, Viewing, viewing_tags
+from app.diary.summary import rebuild_summaries
+from app.diary.fulltext import rebuild_search_index
+from .fake_tmdb import WORDS, details
+
+# The title page looks these two up by name
+USERNAMES = ['alex', 'carrie']
+
+TAG_NAMES = ['funny', 'drama', 'deep', 'classic', 'date night', 'slow-burn', 'twist', 'feel-good',
+             'hidden gem', 'rewatchable', 'visual feast', 'true story', 'cried', 'scary', 'cozy']
+
+RATING_WEIGHTS = [4, 10, 28, 35, 23]
+
+
+class Zipf:
+    """Draws indices in [0, n) with probability proportional to 1 / (i + 1) ** s"""
+
+    def __init__(self, rnd, n, s):
+        self.rnd = rnd
+        self.population = range(n)
+        self.cum_weights = list(itertools.accumulate(1 / (i + 1) ** s for i in range(n)))
+
+    def draw(self):
+        return self.rnd.choices(self.population, cum_weights=self.cum_weights)[0]
+
+
+def _chunks(rows, size=5000):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def generate(users=2, media=2000, viewings=10000, tags=40, cast=12, seed=1):
+    """Replace the database contents with a synthetic diary; returns a summary dict.
+
+    Media get TMDb ids 1..media, matching what the fake TMDb serves for
+    them. Must run inside an app context.
+    """
+    rnd = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+
+    names = (USERNAMES + [f'user{i}' for i in range(3, users + 1)])[:users]
+    db.session.execute(insert(User), [{'username': name, 'password_hash': 'x'} for name in names])
+
+    tag_names = (TAG_NAMES + [f'tag {i}' for i in range(len(TAG_NAMES), tags)])[:tags]
+    db.session.execute(insert(Tag), [{'name': name} for name in tag_names])
+
+    now = datetime.utcnow()
+    media_rows, cast_rows = [], []
+    for tmdb_id in range(1, media + 1):
+        media_type = 'tv' if rnd.random() < 0.3 else 'movie'
+        payload = details(media_type, tmdb_id)
+        media_rows.append({
+            'id': tmdb_id,
+            'tmdb_id': tmdb_id,
+            'media_type': media_type,
+            'title': payload.get('title') or payload.get('name'),
+            'release_year': int((payload.get('release_date') or payload.get('first_air_date'))[:4]),
+            'poster_path': payload['poster_path'],
+            'backdrop_path': payload['backdrop_path'],
+            'overview': payload['overview'],
+            'runtime': payload.get('runtime') or payload['episode_run_time'][0],
+            'genres': [genre['name'] for genre in payload['genres']],
+            'details_fetched_at': now,
+        })
+        for member in payload['credits']['cast'][:cast]:
+            cast_rows.append({'media_id': tmdb_id, 'position': member['order'], 'name': member['name'],
+                              'character': member['character'], 'profile_path': member['profile_path']})
+    for chunk in _chunks(media_rows):
+        db.session.execute(insert(Media), chunk)
+    for chunk in _chunks(cast_rows):
+        db.session.execute(insert(MediaCast), chunk)
+
+    # Popularity order is independent of id order
+    popularity = list(range(1, media + 1))
+    rnd.shuffle(popularity)
+    pick_media = Zipf(rnd, media, 0.8)
+    pick_tag = Zipf(rnd, len(tag_names), 1.0)
+    today = date.today()
+    viewing_rows, tag_rows = [], []
+    for viewing_id in range(1, viewings + 1):
+        days_ago = int(rnd.expovariate(1 / 400)) % (10 * 365)
+        viewing_rows.append({
+            'id': viewing_id,
+            'user_id': rnd.randint(1, len(names)),
+            'media_id': popularity[pick_media.draw()],
+            'rating': rnd.choices(range(1, 6), RATING_WEIGHTS)[0],
+            'comment': ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 40))) if rnd.random() < 0.35 else None,
+            'watched_on': today - timedelta(days=days_ago),
+            'rewatch': rnd.random() < 0.1,
+        })
+        tag_ids = {pick_tag.draw() + 1 for _ in range(rnd.choices([0, 1, 2, 3], [40, 30, 20, 10])[0])}
+        tag_rows.extend({'viewing_id': viewing_id, 'tag_id': tag_id} for tag_id in tag_ids)
+    for chunk in _chunks(viewing_rows):
+        db.session.execute(insert(Viewing), chunk)
+    for chunk in _chunks(tag_rows):
+        db.session.execute(insert(viewing_tags), chunk)
+    db.session.commit()
+
+    if db.engine.dialect.name == 'postgresql':
+        # Explicit ids above leave the sequences behind
+        for table in ('users', 'tags', 'media', 'viewings'):
+            db.session.execute(db.text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"))
+        db.session.commit()
+
+    rebuild_summaries()
+    rebuild_search_index()
+    return {
+        'users': len(names),
+        'media': media,
+        'viewings': viewings,
+        'tags': len(tag_names),
+        'tag_links': len(tag_rows),
+        'watched_media': len({row['media_id'] for row in viewing_rows}),
+    }
@@ -0,0 +1,175 @@
+"""A local stand-in for the TMDb API with configurable latency and 429s.
+
+Answers the endpoints the app calls (configuration, search, details, find)
+with deterministic payloads, so benchmark runs are repeatable and never
+touch the real API. Can also be run on its own for manual testing:
+
+    python -m benchmarks.fake_tmdb --port 8999 --latency-ms 80 --rate-429 0.05
+
+and pointed at with TMDB_BASE_URL=http://127.0.0.1:8999/3.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = ['night', 'city', 'last', 'river', 'house', 'star', 'dark', 'summer', 'love', 'war',
+         'ghost', 'king', 'road', 'blue', 'fire', 'stone', 'island', 'dream', 'shadow', 'storm']
+
+
+def _seeded(*parts):
+    return random.Random(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def title_for(tmdb_id):
+    rnd = _seeded('title', tmdb_id)
+    return ' '.join(rnd.sample(WORDS, rnd.randint(1, 3))).title()
+
+
+def details(media_type, tmdb_id):
+    rnd = _seeded(media_type, tmdb_id)
+    date = f'{rnd.randint(1960, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}'
+    payload = {
+        'id': tmdb_id,
+        'overview': ' '.join(rnd.choice(WORDS) for _ in range(40)).capitalize() + '.',
+        'poster_path': f'/p{tmdb_id}.jpg',
+        'backdrop_path': f'/b{tmdb_id}.jpg',
+        'genres': [{'id': i, 'name': name} for i, name in enumerate(rnd.sample(['Drama', 'Comedy', 'Thriller', 'Horror', 'Romance', 'Sci-Fi'], 2))],
+        'popularity': rnd.random() * 100,
+        'credits': {
+            'cast': [
+                {'name': f'Actor {rnd.randint(1, 5000)}', 'character': f'Role {i}', 'order': i,
+                 'profile_path': f'/a{tmdb_id}-{i}.jpg'}
+                for i in range(30)
+            ],
+            'crew': [],
+        },
+    }
+    if media_type == 'tv':
+        payload.update(name=title_for(tmdb_id), first_air_date=date, episode_run_time=[rnd.randint(20, 60)])
+    else:
+        payload.update(title=title_for(tmdb_id), release_date=date, runtime=rnd.randint(80, 180))
+    return payload
+
+
+def search(media_type, query, page):
+    rnd = _seeded('search', media_type, query.lower(), page)
+    results = []
+    for _ in range(20):
+        tmdb_id = rnd.randint(1, 500000)
+        result = details(media_type, tmdb_id)
+        result.pop('credits')
+        if rnd.random() < 0.3:
+            # Some results should actually contain the query
+            result['title' if media_type == 'movie' else 'name'] = f'{query.title()} {title_for(tmdb_id)}'
+        results.append(result)
+    return {'page': page, 'results': results, 'total_pages': 5, 'total_results': 100}
+
+
+class FakeTMDb:
+    """Serves the fake API from a background thread on 127.0.0.1"""
+
+    def __init__(self, latency_ms=50, jitter_ms=10, rate_429=0.0, port=0, seed=1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.random = random.Random(seed)
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/3'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _delay(self):
+        with self._lock:
+            delay = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            throttle = self.random.random() < self.rate_429
+        return delay, throttle
+
+    def respond(self, path, params):
+        """(status, payload, headers) for one API call"""
+        if path == '/3/configuration':
+            return 200, {'images': {'secure_base_url': 'https://image.tmdb.org/t/p/'}}, {}
+        match = re.fullmatch(r'/3/search/(movie|tv|multi)', path)
+        if match:
+            media_type = 'movie' if match.group(1) == 'multi' else match.group(1)
+            return 200, search(media_type, params.get('query', ''), int(params.get('page', 1))), {}
+        match = re.fullmatch(r'/3/(movie|tv)/(\d+)', path)
+        if match:
+            return 200, details(match.group(1), int(match.group(2))), {}
+        match = re.fullmatch(r'/3/find/(tt\d+)', path)
+        if match:
+            tmdb_id = int(match.group(1)[2:]) % 500000 + 1
+            return 200, {'movie_results': [details('movie', tmdb_id)], 'tv_results': []}, {}
+        return 404, {'status_code': 34, 'status_message': 'The resource you requested could not be found.'}, {}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                delay, throttle = fake._delay()
+                time.sleep(delay)
+
+                if throttle:
+                    status, payload, headers = 429, {'status_code': 25, 'status_message': 'Rate limited'}, {'Retry-After': '1'}
+                else:
+                    status, payload, headers = fake.respond(url.path, params)
+                with fake._lock:
+                    fake.stats['requests'] += 1
+                    fake.stats[str(status)] += 1
+
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the fake TMDb API')
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of calls answered 429')
+    args = parser.parse_args()
+
+    fake = FakeTMDb(args.latency_ms, args.jitter_ms, args.rate_429, args.port)
+    print(f'Fake TMDb listening on {fake.base_url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
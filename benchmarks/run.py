@@ -0,0 +1,236 @@
+"""Run the benchmark scenarios and compare them with a stored baseline.
+
+    python -m benchmarks.run                          # every scenario
+    python -m benchmarks.run -s search -n 100         # one scenario, 100 iterations
+    python -m benchmarks.run --save-baseline          # write benchmarks/baseline.json
+    python -m benchmarks.run --compare                # exit 1 on a regression
+
+The app runs in-process against a freshly generated SQLite database (or
+--database-url, which is wiped first) with TMDb replaced by a local fake
+server. Requests are issued one at a time through the Flask test client;
+latency covers the whole request, query and TMDb call counts come from
+the app's own instrumentation.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+Sample = namedtuple('Sample', 'seconds queries tmdb_calls status')
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, -(-len(ordered) * p // 100) - 1))
+    return ordered[int(index)]
+
+
+class Runner:
+    """Issues requests through a test client and records a Sample for each"""
+
+    def __init__(self, app, client):
+        self.client = client
+        self.samples = []
+        self.recording = False
+        self._last = None
+        app.after_request(self._capture)
+
+    def _capture(self, response):
+        from flask import g
+        stats = g.get('request_stats')
+        self._last = (stats.db_queries, stats.tmdb_calls) if stats else (0, 0)
+        return response
+
+    def request(self, method, url, **kwargs):
+        self._last = None
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, **kwargs)
+        elapsed = time.perf_counter() - started
+        if self.recording:
+            queries, tmdb_calls = self._last or (0, 0)
+            self.samples.append(Sample(elapsed, queries, tmdb_calls, response.status_code))
+        return response
+
+
+def summarize(samples, wall_seconds):
+    latencies = [sample.seconds * 1000 for sample in samples]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample.status >= 400),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_queries': round(sum(sample.queries for sample in samples) / len(samples), 2),
+        'max_queries': max(sample.queries for sample in samples),
+        'mean_tmdb_calls': round(sum(sample.tmdb_calls for sample in samples) / len(samples), 2),
+        'throughput_rps': round(len(samples) / wall_seconds, 1) if wall_seconds else None,
+    }
+
+
+def build_app(args):
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite')
+    os.environ.setdefault('TMDB_API_KEY', 'benchmark')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from app import create_app
+    app = create_app('production')
+    app.config.update(
+        WTF_CSRF_ENABLED=False,
+        SESSION_COOKIE_SECURE=False,
+        SLOW_REQUEST_MS=0,
+        TMDB_BASE_URL=args.tmdb_base_url,
+    )
+    return app
+
+
+def build_context(app, summary):
+    from sqlalchemy import func
+    from app.extensions import db
+    from app.models import Media, Tag, Viewing, viewing_tags
+    from .fake_tmdb import WORDS
+
+    with app.app_context():
+        year = db.session.query(db.extract('year', Viewing.watched_on).label('year'))\
+                         .group_by('year').order_by(func.count().desc()).first()[0]
+        tag_names = [name for name, in db.session.query(Tag.name)
+                                                 .join(viewing_tags, viewing_tags.c.tag_id == Tag.id)
+                                                 .group_by(Tag.name).order_by(func.count().desc())]
+        titles = [(media_type, tmdb_id) for media_type, tmdb_id in
+                  db.session.query(Media.media_type, Media.tmdb_id).order_by(Media.id)]
+    return {
+        'year': int(year),
+        'tag': tag_names[0],
+        'tag_names': tag_names,
+        'titles': [titles[start:start + 10] for start in range(0, len(titles), 10)],
+        'cold_ids': list(range(10_000_000, 10_000_000 + 10_000)),
+        'search_words': WORDS,
+        'keystrokes': itertools.count(1),
+    }
+
+
+def login(app, client, username='alex'):
+    from app.models import User
+    with app.app_context():
+        user_id = User.query.filter_by(username=username).first().id
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+
+def compare(results, baseline, tolerance, min_delta_ms=2.0):
+    """Print each scenario against the baseline; returns the regressed names"""
+    regressed = []
+    print(f"\n{'scenario':<22} {'p95 ms':>18} {'queries/req':>18}")
+    for name, result in results.items():
+        before = baseline['scenarios'].get(name)
+        if not before:
+            print(f'{name:<22} (not in baseline)')
+            continue
+        p95_change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0
+        # Sub-millisecond noise on fast endpoints isn't a regression
+        slower = p95_change > tolerance and result['p95_ms'] - before['p95_ms'] > min_delta_ms
+        more_queries = result['mean_queries'] > before['mean_queries'] + 0.5
+        flag = '  REGRESSION' if slower or more_queries else ''
+        print(f"{name:<22} {before['p95_ms']:>7} -> {result['p95_ms']:<8} "
+              f"{before['mean_queries']:>7} -> {result['mean_queries']:<8}{flag}")
+        if flag:
+            regressed.append(name)
+    return regressed
+
+
+def main(argv=None):
+    from .scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS), help='Run only these (repeatable)')
+    parser.add_argument('-n', '--iterations', type=int, default=10, help='Measured iterations per scenario')
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--media', type=int, default=2000)
+    parser.add_argument('--viewings', type=int, default=10000)
+    parser.add_argument('--tags', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='Benchmark against this database instead of a temporary SQLite file (ALL DATA IS DROPPED)')
+    parser.add_argument('--tmdb-latency-ms', type=float, default=50)
+    parser.add_argument('--tmdb-jitter-ms', type=float, default=10)
+    parser.add_argument('--tmdb-429-rate', type=float, default=0.0, help='Fraction of TMDb calls answered 429')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='Compare with the baseline; exit 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown before --compare fails')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='Ignore p95 slowdowns smaller than this')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    from .fake_tmdb import FakeTMDb
+    fake = FakeTMDb(args.tmdb_latency_ms, args.tmdb_jitter_ms, args.tmdb_429_rate, seed=args.seed)
+    args.tmdb_base_url = fake.start()
+
+    app = build_app(args)
+    from .datagen import generate
+    started = time.perf_counter()
+    with app.app_context():
+        summary = generate(args.users, args.media, args.viewings, args.tags, seed=args.seed)
+    print(f"Generated {summary['viewings']} viewings of {summary['watched_media']} titles "
+          f"({summary['media']} media, {summary['tag_links']} tag links) in {time.perf_counter() - started:.1f}s",
+          file=sys.stderr)
+
+    client = app.test_client()
+    runner = Runner(app, client)
+    login(app, client)
+    ctx = build_context(app, summary)
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        scenario, warm_up = SCENARIOS[name]
+        if warm_up:
+            scenario(runner, ctx, 0)
+        runner.samples = []
+        runner.recording = True
+        started = time.perf_counter()
+        for iteration in range(args.iterations):
+            scenario(runner, ctx, iteration)
+        wall = time.perf_counter() - started
+        runner.recording = False
+        results[name] = summarize(runner.samples, wall)
+    fake.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"\n{'scenario':<22} {'reqs':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'queries':>8} {'max q':>6} {'tmdb':>6} {'req/s':>8}")
+        for name, r in results.items():
+            print(f"{name:<22} {r['requests']:>6} {r['errors']:>4} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+                  f"{r['mean_queries']:>8} {r['max_queries']:>6} {r['mean_tmdb_calls']:>6} {r['throughput_rps']:>8}")
+        print(f"\nFake TMDb: {dict(fake.stats)}", file=sys.stderr)
+
+    params = {key: getattr(args, key) for key in ('iterations', 'users', 'media', 'viewings', 'tags', 'seed',
+                                                   'tmdb_latency_ms', 'tmdb_jitter_ms', 'tmdb_429_rate')}
+    params['database'] = os.environ['DATABASE_URL'].split(':', 1)[0]
+
+    if args.compare:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        if baseline['params'] != params:
+            print(f"Warning: baseline was recorded with {baseline['params']}", file=sys.stderr)
+        if compare(results, baseline, args.tolerance, args.min_delta_ms):
+            return 1
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fh:
+            json.dump({'params': params, 'python': platform.python_version(), 'scenarios': results}, fh, indent=2)
+            fh.write('\n')
+        print(f'Baseline written to {args.baseline}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
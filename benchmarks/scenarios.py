@@ -0,0 +1,88 @@
+"""Scripted request mixes, one function per scenario.
+
+Each scenario drives ``runner.request(...)`` for one iteration; the runner
+times every request and collects its query and TMDb counts.
+"""
+import itertools
+import re
+from datetime import date
+
+_NEXT_CURSOR = re.compile(r'/diary/me/cards\?[^"]*cursor=([A-Za-z0-9_-]+)')
+
+
+def my_diary_filters(runner, ctx, iteration):
+    """First page of the diary under every filter and sort combination"""
+    for media_type, sort, rating, year, tag in itertools.product(
+            (None, 'movie', 'tv'), ('newest', 'highest_rated'), (None, 4),
+            (None, ctx['year']), (None, ctx['tag'])):
+        params = {'media_type': media_type, 'sort': sort, 'rating': rating, 'year': year, 'tags': tag}
+        runner.request('GET', '/diary/me', query_string={k: v for k, v in params.items() if v})
+
+
+def my_diary_deep_pages(runner, ctx, iteration, pages=25):
+    """Follow the infinite-scroll cursor down ``pages`` pages"""
+    sort = ('newest', 'highest_rated')[iteration % 2]
+    response = runner.request('GET', '/diary/me', query_string={'sort': sort})
+    for _ in range(pages):
+        match = _NEXT_CURSOR.search(response.get_data(as_text=True))
+        if not match:
+            break
+        response = runner.request('GET', '/diary/me/cards', query_string={'sort': sort, 'cursor': match.group(1)},
+                                  headers={'HX-Request': 'true'})
+
+
+def title_detail_warm(runner, ctx, iteration):
+    """Title pages of media already in the database"""
+    for media_type, tmdb_id in ctx['titles'][iteration % len(ctx['titles'])]:
+        runner.request('GET', f'/title/{media_type}/{tmdb_id}')
+
+
+def title_detail_cold(runner, ctx, iteration):
+    """Title pages of media never seen before (details come from TMDb)"""
+    tmdb_id = ctx['cold_ids'].pop()
+    runner.request('GET', f'/title/movie/{tmdb_id}')
+
+
+def search(runner, ctx, iteration):
+    """Type-ahead search: one request per keystroke past the minimum length"""
+    words = ctx['search_words']
+    word = words[iteration % len(words)]
+    if iteration >= len(words):
+        # Later passes type two-word queries so each one is new to the caches
+        word += ' ' + words[(iteration // len(words)) % len(words)]
+    for end in range(2, len(word) + 1):
+        # The search box numbers keystrokes so stale responses can be dropped
+        runner.request('GET', '/search', query_string={'q': word[:end], 'seq': next(ctx['keystrokes'])},
+                       headers={'HX-Request': 'true'})
+
+
+def tags_autocomplete(runner, ctx, iteration):
+    """Tag suggestions for every prefix of a tag name"""
+    name = ctx['tag_names'][iteration % len(ctx['tag_names'])]
+    for end in range(1, len(name) + 1):
+        runner.request('GET', '/tags/autocomplete', query_string={'q': name[:end]})
+
+
+def create_viewing(runner, ctx, iteration):
+    """Add a viewing with tags through the modal form"""
+    media_type, tmdb_id = ctx['titles'][iteration % len(ctx['titles'])][0]
+    runner.request('POST', '/viewing', headers={'HX-Request': 'true'}, data={
+        'tmdb_id': str(tmdb_id),
+        'media_type': media_type,
+        'rating': str(iteration % 5 + 1),
+        'watched_on': date.today().isoformat(),
+        'comment': f'Benchmark viewing {iteration}',
+        'tags': ', '.join(ctx['tag_names'][iteration % 3:iteration % 3 + 2]),
+    })
+
+
+# name -> (function, whether to run one unmeasured warm-up iteration)
+SCENARIOS = {
+    'my_diary_filters': (my_diary_filters, True),
+    'my_diary_deep_pages': (my_diary_deep_pages, True),
+    'title_detail_cold': (title_detail_cold, False),
+    'title_detail_warm': (title_detail_warm, True),
+    'search': (search, False),
+    'tags_autocomplete': (tags_autocomplete, True),
+    'create_viewing': (create_viewing, False),
+}
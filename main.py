@@ -1,18 +1,9 @@
 from app import create_app
 import os
-from app.extensions import db  # changed import
-from app.models import Tag
 
+# Schema and default tags are set up by `flask --app main deploy`, not here
 app = create_app()
 
-with app.app_context():
-    db.create_all()
-    if Tag.query.count() == 0:
-        tags = ['funny', 'action', 'drama', 'sci-fi', 'horror', 'romance', 'thriller']
-        for t in tags:
-            db.session.add(Tag(name=t))
-        db.session.commit()
-
 
 if app.debug:
     app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 0  # ensure static (JS/CSS) not cached
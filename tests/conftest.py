@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Config reads the environment at import time: never point tests at a real database
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.sqlite')
+os.environ.setdefault('TMDB_API_KEY', 'test')
+
+from app import create_app
+from app.extensions import db
+from app.media.tmdb import tmdb_client
+from app.models import User
+from benchmarks.fake_tmdb import FakeTMDb
+
+
+@pytest.fixture(scope='session')
+def fake_tmdb():
+    """Base URL of a local fake TMDb API"""
+    fake = FakeTMDb(latency_ms=0, jitter_ms=0)
+    yield fake.start()
+    fake.stop()
+
+
+@pytest.fixture
+def app(fake_tmdb):
+    app = create_app('development')
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, TMDB_BASE_URL=fake_tmdb,
+                      TMDB_IMAGE_CONFIG_REFRESH_SECONDS=0)
+    # The client keeps the base URL from the first app it saw
+    tmdb_client.base_url = fake_tmdb
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def user(app):
+    user = User(username='alex')
+    user.set_password('alex')
+    db.session.add(user)
+    db.session.commit()
+    return user
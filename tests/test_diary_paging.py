@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+import pytest
+from app.diary.queries import diary_page, encode_cursor
+from app.diary.summary import rebuild_summaries
+from app.extensions import db
+from app.models import Media, MediaDiarySummary, Viewing
+
+SORTS = ['newest', 'highest_rated']
+
+
+@pytest.fixture
+def diary(app, user):
+    """Eleven titles with repeated dates and ratings, so page boundaries fall on ties"""
+    start = date(2024, 1, 1)
+    for i in range(11):
+        media = Media(tmdb_id=100 + i, media_type='movie', title=f'Title {i}')
+        db.session.add(media)
+        db.session.flush()
+        db.session.add(Viewing(user_id=user.id, media_id=media.id, rating=i % 3 + 3,
+                               watched_on=start + timedelta(days=i // 2)))
+    db.session.commit()
+    rebuild_summaries()
+
+
+def page(sort, cursor=None, per_page=4):
+    return diary_page({'sort': sort}, cursor, per_page, lambda media_list, summaries: [m.id for m in media_list])
+
+
+def expected_order(sort):
+    summaries = MediaDiarySummary.query.all()
+    if sort == 'highest_rated':
+        key = lambda s: (s.max_rating, s.last_watched_on, s.media_id)
+    else:
+        key = lambda s: (s.last_watched_on, s.media_id)
+    return [s.media_id for s in sorted(summaries, key=key, reverse=True)]
+
+
+@pytest.mark.parametrize('sort', SORTS)
+def test_next_pages_cover_the_diary_once(diary, sort):
+    pages = [page(sort)]
+    while pages[-1].has_next:
+        pages.append(page(sort, pages[-1].next_cursor))
+
+    seen = [media_id for p in pages for media_id in p.items]
+    assert seen == expected_order(sort)
+    assert [len(p.items) for p in pages] == [4, 4, 3]
+    assert not pages[0].has_prev
+
+
+@pytest.mark.parametrize('sort', SORTS)
+def test_prev_returns_the_previous_page(diary, sort):
+    first = page(sort)
+    second = page(sort, first.next_cursor)
+    third = page(sort, second.next_cursor)
+
+    back = page(sort, third.prev_cursor)
+    assert back.items == second.items
+    assert not set(back.items) & set(third.items)
+    assert page(sort, back.prev_cursor).items == first.items
+    assert not page(sort, back.prev_cursor).has_prev
+
+
+@pytest.mark.parametrize('cursor', ['garbage', '!!!', encode_cursor('sideways', [1, 2]), encode_cursor('next', [1])])
+@pytest.mark.parametrize('sort', SORTS)
+def test_bad_cursor_falls_back_to_the_first_page(diary, sort, cursor):
+    assert page(sort, cursor).items == page(sort).items
@@ -0,0 +1,70 @@
+import io
+from datetime import date
+from app.diary.importer import ImportJob, ImportStats, detect_format, import_diary, parse_imdb, parse_letterboxd
+from app.models import Viewing
+
+LETTERBOXD_HEADER = 'Date,Name,Year,Letterboxd URI,Rating,Rewatch,Tags,Watched Date\n'
+
+
+def letterboxd_csv(*rows):
+    """Letterboxd diary CSV for (title, watched_on, rating, tags) rows"""
+    lines = [f'{day},{title},1999,,{rating},,"{tags}",{day}\n' for title, day, rating, tags in rows]
+    return LETTERBOXD_HEADER + ''.join(lines)
+
+
+def test_detect_format():
+    assert detect_format(['Date', 'Name', 'Year', 'Rating']) == 'letterboxd'
+    assert detect_format(['Const', 'Your Rating', 'Title']) == 'imdb'
+    assert detect_format(['title', 'score']) is None
+
+
+def test_parse_letterboxd_row():
+    entry = parse_letterboxd({'Name': ' Heat ', 'Year': '1995', 'Rating': '3.5', 'Rewatch': 'Yes',
+                              'Tags': 'Crime, crime, ,Heist', 'Watched Date': '2023-05-01'})
+    assert entry['title'] == 'Heat'
+    assert entry['year'] == 1995
+    assert entry['rating'] == 4
+    assert entry['rewatch'] is True
+    assert entry['watched_on'] == date(2023, 5, 1)
+    assert entry['tags'] == ['crime', 'heist']
+
+
+def test_parse_imdb_row():
+    show = parse_imdb({'Const': 'tt0903747', 'Title': 'Breaking Bad', 'Title Type': 'tvSeries',
+                       'Your Rating': '9', 'Date Rated': '2020-01-02', 'Year': '2008'})
+    assert show['media_type'] == 'tv'
+    assert show['imdb_id'] == 'tt0903747'
+    assert show['rating'] == 5
+    assert parse_imdb({'Title': 'Pilot', 'Title Type': 'tvEpisode', 'Your Rating': '7'}) is None
+
+
+def test_repeated_tag_is_linked_once(app, user):
+    stats = import_diary(io.StringIO(letterboxd_csv(('Alien', '2023-01-01', '4', 'Horror, horror'))), user.id)
+    assert stats.imported == 1
+    assert [tag.name for tag in Viewing.query.one().tags] == ['horror']
+
+
+def test_reimport_skips_existing_rows(app, user):
+    export = letterboxd_csv(('Alien', '2023-01-01', '4', ''), ('Heat', '2023-01-02', '5', 'crime'))
+    import_diary(io.StringIO(export), user.id)
+    stats = import_diary(io.StringIO(export), user.id)
+    assert stats.imported == 0
+    assert stats.duplicates == 2
+    assert Viewing.query.count() == 2
+
+
+def test_job_resumes_after_last_committed_row(app, user, tmp_path):
+    path = tmp_path / 'export.csv'
+    path.write_text(letterboxd_csv(('Alien', '2023-01-01', '4', ''), ('Heat', '2023-01-02', '5', ''),
+                                   ('Jaws', '2023-01-03', '3', ''), ('Ran', '2023-01-04', '4', '')))
+    job = ImportJob(str(path))
+    # An earlier run committed the first two rows and then died
+    job.write(state='failed', **ImportStats(rows=2, imported=2).as_dict())
+
+    status = job.run(user.id, batch_size=1, concurrency=1)
+
+    assert status['state'] == 'done'
+    assert status['rows'] == 4
+    assert status['imported'] == 4
+    assert Viewing.query.count() == 2
+    assert job.run(user.id)['imported'] == 4
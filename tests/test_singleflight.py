@@ -0,0 +1,83 @@
+import threading
+import time
+import pytest
+from app.media.singleflight import SingleFlight
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def _run_concurrently(flight, fn, callers):
+    """Start one leader and ``callers - 1`` followers on the same key; returns
+    (results, errors) once fn has been released and every caller finished"""
+    release = threading.Event()
+    results, errors = [], []
+
+    def gated():
+        release.wait(5)
+        return fn()
+
+    def call():
+        try:
+            results.append(flight.do('movie/1', gated))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    threads[0].start()
+    _wait_for(lambda: flight.in_flight() == 1)
+    for thread in threads[1:]:
+        thread.start()
+    _wait_for(lambda: flight._calls['movie/1'].followers == callers - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {'id': 1, 'genres': ['Drama']}
+
+    results, errors = _run_concurrently(flight, fetch, callers=8)
+
+    assert len(calls) == 1
+    assert not errors
+    assert results == [{'id': 1, 'genres': ['Drama']}] * 8
+    # Each caller gets its own copy to mutate
+    results[0]['genres'].append('Crime')
+    assert all(result['genres'] == ['Drama'] for result in results[1:])
+    assert flight.in_flight() == 0
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise RuntimeError('TMDb is down')
+
+    results, errors = _run_concurrently(flight, fetch, callers=5)
+
+    assert len(calls) == 1
+    assert not results
+    assert len(errors) == 5
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+def test_nothing_is_remembered_after_the_call():
+    flight = SingleFlight()
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do('key', int, 'not a number')
+    assert flight.do('key', lambda: 3) == 3
@@ -0,0 +1,88 @@
+import time
+from types import SimpleNamespace
+import pytest
+from app import cache
+from app.media import ratelimit
+from app.media.ratelimit import CircuitBreaker
+from app.media.tmdb import TMDbClient, TMDbUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, 'time', SimpleNamespace(time=clock))
+    return clock
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    # Only one trial call at a time
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_released_trial_can_be_retried(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_open_circuit_serves_stale_copy(app, monkeypatch):
+    client = TMDbClient()
+    fresh = client._make_request('/movie/5')
+    assert client.request_stats()['requests'] == 1
+
+    # A day later the cached copy has expired and TMDb has been failing
+    later = time.time() + 2 * 24 * 60 * 60
+    monkeypatch.setattr(cache, 'time', SimpleNamespace(time=lambda: later))
+    for _ in range(client.breaker.failure_threshold):
+        client.breaker.record_failure()
+
+    assert client._make_request('/movie/5') == fresh
+    stats = client.request_stats()
+    assert stats['requests'] == 1
+    assert stats['short_circuited'] == 1
+    assert stats['stale_served'] == 1
+    assert stats['circuit'] == CircuitBreaker.OPEN
+
+    # Nothing cached to fall back on
+    with pytest.raises(TMDbUnavailable):
+        client._make_request('/movie/6')